@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+#
+# Benchmarks for gensynet
+#
+# Times subnet planning, host generation and serialization over a sweep of
+# network sizes, and writes the results as JSON so that runs of different
+# versions can be compared.
+#
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import sys
+import tempfile
+import time
+
+import gensynet
+
+DEFAULT_NODES = [1000, 10000, 100000]
+FULL_NODES = [1000, 10000, 100000, 1000000, gensynet.MAX_NODES]
+FLOW_RECORDS = 1000000
+SEED = 1
+
+
+def peak_rss():
+    """Returns the peak resident set size of this process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def plan(nodect, seed=SEED):
+    """Returns the subnet specifications of a network of nodect hosts, the way main() builds them by default."""
+    subnets = gensynet.randomize_subnet_breakdown(nodect, 104, 150, seed) if nodect > 252 else [nodect]
+    dev = gensynet.get_default_dev_distro(nodect, printout=False)
+    return gensynet.build_configs(subnets, nodect, dev, seed=seed)
+
+
+def bench_planning(nodect):
+    """Times each of the planning phases for nodect hosts."""
+    dev = gensynet.get_default_dev_distro(nodect, printout=False)
+    phases = {}
+
+    t = time.perf_counter()
+    subnets = gensynet.randomize_subnet_breakdown(nodect, 104, 150, SEED) if nodect > 252 else [nodect]
+    phases['randomize_subnet_breakdown'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    gensynet.build_configs(subnets, nodect, dev, seed=SEED)
+    phases['build_configs'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    gensynet.build_configs_deprecated(nodect, [(30, 70), (45, 20), (25, 90)], dev, seed=SEED)
+    phases['build_configs_deprecated'] = time.perf_counter() - t
+
+    return {'subnets': len(subnets), 'phases': phases}
+
+
+def bench_network(nodect, engine, randomspace, prettyprint, fmt):
+    """Times build_network() for nodect hosts, writing to the null device."""
+    net_configs = plan(nodect)
+    instrument = gensynet.Instrumentation()
+    t = time.perf_counter()
+    gensynet.build_network(net_configs, os.devnull, randomspace, prettyprint, engine, seed=SEED, fmt=fmt,
+                           instrument=instrument)
+    elapsed = time.perf_counter() - t
+    summary = instrument.summary()
+    phases = dict(summary['phases'], build_network=elapsed)
+    return {'phases': phases, 'hosts_per_sec': nodect / elapsed if elapsed else None,
+            'subnet_hosts_per_sec': summary['subnet_hosts_per_sec']}
+
+
+def bench_flows(nodect, fmt):
+    """Times reading the hosts of nodect into a FlowGenerator, then writing FLOW_RECORDS flows to the null device."""
+    net_configs = plan(nodect)
+    t = time.perf_counter()
+    flows = gensynet.FlowGenerator(gensynet.iter_hosts(net_configs, seed=SEED), seed=SEED)
+    inventory = time.perf_counter() - t
+    t = time.perf_counter()
+    with open(os.devnull, 'w') as ofile:
+        flows.write(ofile, FLOW_RECORDS, fmt, start=0)
+    elapsed = time.perf_counter() - t
+    return {'phases': {'inventory': inventory, 'flows': elapsed}, 'flows_per_sec': FLOW_RECORDS / elapsed}
+
+
+def bench_validate(nodect, fmt):
+    """Times validate_network() over the hosts of nodect, written to a temporary file in the given format."""
+    net_configs = plan(nodect)
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = os.path.join(tmp, 'network' + gensynet.EXTENSIONS[fmt])
+        gensynet.build_network(net_configs, fname, prettyprint=False, seed=SEED, fmt=fmt)
+        t = time.perf_counter()
+        report = gensynet.validate_network(fname, net_configs)
+        elapsed = time.perf_counter() - t
+    if not report['valid']:
+        raise ValueError("{} network failed validation: {}".format(fmt, report['violations']))
+    return {'phases': {'validate': elapsed}, 'hosts_per_sec': nodect / elapsed}
+
+
+def _run_case(func, args, results):
+    try:
+        result = func(*args)
+    except Exception as e:
+        results.put({'error': '{}: {}'.format(type(e).__name__, e)})
+        return
+    result['peak_rss'] = peak_rss()
+    results.put(result)
+
+
+def run_case(func, *args, timeout=None):
+    """Runs one benchmark case in a fresh process, so that its peak memory use is its own.
+
+    A case that raises, dies (e.g. killed for running out of memory) or takes more than timeout seconds comes back as
+    {'error': reason}."""
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    proc = ctx.Process(target=_run_case, args=(func, args, results))
+    proc.start()
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if proc.exitcode is not None:
+                try:        # whatever it put may still have been on its way
+                    result = results.get(timeout=1)
+                except queue.Empty:
+                    result = {'error': 'process exited with code {}'.format(proc.exitcode)}
+                break
+            if deadline and time.monotonic() > deadline:
+                proc.terminate()
+                result = {'error': 'timed out after {}s'.format(timeout)}
+                break
+    proc.join()
+    return result
+
+
+def cases(nodects, engines, formats):
+    """Yields (name, parameters, function, arguments) for every case of the sweep."""
+    for nodect in nodects:
+        yield 'planning', {'nodes': nodect}, bench_planning, (nodect,)
+        for engine in engines:
+            for fmt in formats:
+                for randomspace in (False, True):
+                    for prettyprint in ((True, False) if fmt == 'json' else (False,)):
+                        params = {'nodes': nodect, 'engine': engine, 'format': fmt, 'randomspace': randomspace,
+                                  'prettyprint': prettyprint}
+                        yield 'build_network', params, bench_network, (nodect, engine, randomspace, prettyprint, fmt)
+        for fmt in formats:
+            yield 'validate', {'nodes': nodect, 'format': fmt}, bench_validate, (nodect, fmt)
+        for fmt in gensynet.FLOW_FORMATS:
+            yield 'flows', {'nodes': nodect, 'format': fmt}, bench_flows, (nodect, fmt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks gensynet planning, generation and serialization')
+    parser.add_argument('-n', '--nodes', help='Network sizes to sweep [{}]'.format(DEFAULT_NODES), type=int, nargs='+')
+    parser.add_argument('--full', help='Sweep up to {} nodes'.format(gensynet.MAX_NODES), action='store_true')
+    parser.add_argument('-e', '--engine', help='Engines to compare [all available]', choices=gensynet.ENGINES,
+                        nargs='+')
+    parser.add_argument('-f', '--format', help='Output formats to compare [json]', choices=gensynet.FORMATS,
+                        nargs='+', default=['json'])
+    parser.add_argument('-o', '--output', help='File to write the JSON results to [stdout]')
+    parser.add_argument('-t', '--timeout', help='Seconds after which a case is given up on [none]', type=float)
+    args = parser.parse_args()
+
+    nodects = args.nodes or (FULL_NODES if args.full else DEFAULT_NODES)
+    engines = args.engine or [e for e in gensynet.ENGINES if e != 'numpy' or gensynet.np is not None]
+
+    results = []
+    for name, params, func, fargs in cases(nodects, engines, args.format):
+        result = dict(params, benchmark=name, **run_case(func, *fargs, timeout=args.timeout))
+        results.append(result)
+        if 'error' in result:
+            print("{:>14} {}: FAILED: {}".format(name, params, result['error']), file=sys.stderr)
+            continue
+        timings = ', '.join('{} {:.3f}s'.format(k, v) for k, v in result['phases'].items())
+        rate = ' ({:,.0f} hosts/s)'.format(result['hosts_per_sec']) if result.get('hosts_per_sec') else ''
+        if result.get('flows_per_sec'):
+            rate = ' ({:,.0f} flows/s)'.format(result['flows_per_sec'])
+        print("{:>14} {}: {}{}, peak RSS {:.1f} MB".format(name, params, timings, rate, result['peak_rss'] / 2**20),
+              file=sys.stderr)
+
+    report = {
+        'gensynet_version': gensynet.VERSION,
+        'python': platform.python_version(),
+        'numpy': gensynet.np.__version__ if gensynet.np is not None else None,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': SEED,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as ofile:
+            json.dump(report, ofile, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    sys.exit(1 if any('error' in r for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
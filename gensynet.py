@@ -13,16 +13,45 @@
 #
 
 import argparse
+from array import array
+import asyncio
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import functools
 from datetime import datetime as dt
+from datetime import timedelta
+import gzip
+import hashlib
+import io
 import ipaddress
+import itertools
 import json
 import math
+import mmap
+import multiprocessing
+import os
+import re
 from random import *
+import random as _random
 import string
 import sys
 import time
+import urllib.parse
 import uuid
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 VERBOSE = False
 NET_SUMMARY = False
 VERSION = '0.81'
@@ -30,8 +59,19 @@ DEBUG = False
 OLDVERSION = False
 
 
-def randstring(size):
-    return ''.join(choice(string.ascii_lowercase + string.digits)
+def seeded_rng(seed=None):
+    """Returns a random generator for seed: the shared global one for None, or seed itself if it's already a Random
+    (or the random module)."""
+    if seed is None or seed is _random:
+        return _random
+    if isinstance(seed, _random.Random):
+        return seed
+    return _random.Random(seed)
+
+
+def randstring(size, rng=None):
+    rng = rng or _random
+    return ''.join(rng.choice(string.ascii_lowercase + string.digits)
                     for _ in range(size))
 
 
@@ -42,73 +82,74 @@ def divide(dividend, divisor):
 
 # you'll want to make sure that prefix is some string that
 # is prefixed by some number.
-def generate_ip(prefix, octets=4):
+def generate_ip(prefix, octets=4, rng=None):
+    rng = rng or _random
     ip = prefix
     if prefix[len(prefix)-1] is not '.':
         prefix = prefix + '.'
     subn = 4 - prefix.count('.')
     if (subn > 0):
-        ip = prefix + '.'.join(str(randint(1,252)) for _ in range(subn))
+        ip = prefix + '.'.join(str(rng.randint(1,252)) for _ in range(subn))
     return ip
 
 
-def generate_uuid():
-    return str(uuid.uuid4())
+def generate_uuid(rng=None):
+    rng = rng or _random
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
 
 
-def generate_fqdn(domain=None, subdomains=0):
+def generate_fqdn(domain=None, subdomains=0, seed=None):
+    rng = seeded_rng(seed)
     if domain is None:
-        domain = randstring(randint(5,10)) + '.local'
+        domain = randstring(rng.randint(5,10), rng) + '.local'
     if subdomains == 0:
         return domain
     else:
         hostname = domain
 
     while (subdomains > 0):
-        hostname = randstring(randint(3,5)) + '.' + hostname
+        hostname = randstring(rng.randint(3,5), rng) + '.' + hostname
         subdomains -= 1
     return hostname
 
 
-def generate_os_type(devicetype):
-    if ( devicetype == 'Business workstation'
-      or devicetype == 'Developer workstation'
-      or devicetype == 'Mail server'
-      or devicetype == 'File server'
-      or devicetype == 'Internal web server'
-      or devicetype == 'Database server'
-      or devicetype == 'Code repository'
-      or devicetype == 'SSH server'):
-        return choice(['Windows', 'Linux', 'Mac OS X', 'BSD'])
-    elif devicetype == 'Smartphone':
-        return choice(['iOS', 'Android', 'Blackberry', 'Unknown'])
-    elif devicetype == 'DNS server':
-        return choice(['Windows', 'Linux', 'Mac OS X', 'BSD', 'Cisco IOS'])
-    elif ( devicetype == 'Printer'
-      or devicetype == 'PBX'):
-        return choice(['Linux', 'Unknown', 'Windows'])
-    elif devicetype == 'DHCP server':
-        return choice(['Linux', 'Unknown', 'Windows', 'BSD', 'Cisco IOS'])
-    elif devicetype == 'Active Directory controller':
-        return choice(['Unknown', 'Windows'])
-    elif devicetype == 'VOIP phone':
-        return choice(['Linux', 'Windows', 'Unknown'])
-    elif devicetype == 'Unknown':
-        return 'Unknown'
-    return os
-
-
-def generate_mac():
-    mac = ':'.join(str(hex(randint(0,15))) + str(hex(randint(0,15)))
+OS_TYPES = {
+    'Business workstation': ['Windows', 'Linux', 'Mac OS X', 'BSD'],
+    'Developer workstation': ['Windows', 'Linux', 'Mac OS X', 'BSD'],
+    'Mail server': ['Windows', 'Linux', 'Mac OS X', 'BSD'],
+    'File server': ['Windows', 'Linux', 'Mac OS X', 'BSD'],
+    'Internal web server': ['Windows', 'Linux', 'Mac OS X', 'BSD'],
+    'Database server': ['Windows', 'Linux', 'Mac OS X', 'BSD'],
+    'Code repository': ['Windows', 'Linux', 'Mac OS X', 'BSD'],
+    'SSH server': ['Windows', 'Linux', 'Mac OS X', 'BSD'],
+    'Smartphone': ['iOS', 'Android', 'Blackberry', 'Unknown'],
+    'DNS server': ['Windows', 'Linux', 'Mac OS X', 'BSD', 'Cisco IOS'],
+    'Printer': ['Linux', 'Unknown', 'Windows'],
+    'PBX': ['Linux', 'Unknown', 'Windows'],
+    'DHCP server': ['Linux', 'Unknown', 'Windows', 'BSD', 'Cisco IOS'],
+    'Active Directory controller': ['Unknown', 'Windows'],
+    'VOIP phone': ['Linux', 'Windows', 'Unknown'],
+    'Unknown': ['Unknown']
+}
+
+RECORD_SOURCES = ['p0f', 'nmap', 'BCF']
+
+
+def generate_os_type(devicetype, rng=None):
+    rng = rng or _random
+    return rng.choice(OS_TYPES.get(devicetype, ['Unknown']))
+
+
+def generate_mac(rng=None):
+    rng = rng or _random
+    mac = ':'.join(str(hex(rng.randint(0,15))) + str(hex(rng.randint(0,15)))
                    for _ in range(6))
     return mac.replace('0x', '')
 
 
-def record(records=None):
-    records = [ 'p0f',
-                'nmap',
-                'BCF']
-    return choice(records)
+def record(records=None, rng=None):
+    rng = rng or _random
+    return rng.choice(RECORD_SOURCES)
 
 
 def calculate_subnets(total, breakdown):
@@ -163,45 +204,167 @@ def get_default_dev_distro(nodect, printout=True):
     return dev_breakdown
 
 
-def build_configs(subnets, host_count, dev_div, domain=None):
-    """Returns a json object of subnet specifications, or None upon error"""
+def _hypergeometric(rng, good, bad, draws):
+    """Returns how many of draws items taken without replacement from good good ones and bad bad ones are good.
+
+    The search for rng.random() in the cumulative distribution starts at the mode and steps out on both sides, so it
+    takes about as many steps as the standard deviation."""
+    lo, hi = max(0, draws - bad), min(good, draws)
+    if lo == hi:
+        return lo
+    mode = min(max((draws + 1) * (good + 1) // (good + bad + 2), lo), hi)
+
+    def log_choose(n, k):
+        return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+
+    p = math.exp(log_choose(good, mode) + log_choose(bad, draws - mode) - log_choose(good + bad, draws))
+    u = rng.random() - p
+    up = down = mode
+    p_up = p_down = p
+    while u >= 0 and (up < hi or down > lo):
+        if up < hi:
+            p_up *= (good - up) * (draws - up) / ((up + 1) * (bad - draws + up + 1))
+            up += 1
+            u -= p_up
+            if u < 0:
+                return up
+        if down > lo:
+            p_down *= down * (bad - draws + down) / ((good - down + 1) * (draws - down + 1))
+            down -= 1
+            u -= p_down
+            if u < 0:
+                return down
+    return mode                 # only when rounding leaves u a hair above the total
+
+
+def allocate_roles(capacities, dev_div, seed=None):
+    """Splits the device counts in dev_div across subnets with the given capacities; returns a role count dict per subnet.
+
+    Every host slot in the network is equally likely to get any of the remaining devices, so each subnet's roles follow a
+    multivariate hypergeometric distribution and the totals come out exact. Each subnet draws its count of every device
+    in turn from what the subnets before it left, so the work grows with subnets times devices rather than hosts.
+    Devices that don't fit are dropped, and slots left over stay unlabeled."""
+    rng = seeded_rng(seed)
+    devs = list(dev_div)
+    slots = sum(capacities)
+    devices = sum(dev_div.values())
+    if devices > slots:
+        print("WARNING: {} devices won't fit in {} hosts; dropping the surplus".format(devices, slots))
+    remaining = [dev_div[dev] for dev in devs]
+    left = max(slots, devices)  # devices still to deal out and unlabeled slots
+
+    allocation = []
+    for cap in capacities:
+        counts = dict.fromkeys(devs, 0)
+        pool = left
+        draws = cap
+        for i, dev in enumerate(devs):
+            if not draws:
+                break
+            good = remaining[i]
+            counts[dev] = _hypergeometric(rng, good, pool - good, draws)
+            remaining[i] -= counts[dev]
+            draws -= counts[dev]
+            pool -= good
+        allocation.append(counts)
+        left -= cap
+    return allocation
+
+
+def allocate_subnets(count, supernet='10.0.0.0/8', prefixlen=24, seed=None):
+    """Returns count unique, randomly placed subnets of the given prefix length carved out of supernet (IPv4 or IPv6).
+
+    Raises ValueError if supernet can't hold that many subnets."""
+    supernet = ipaddress.ip_network(supernet)
+    if prefixlen < supernet.prefixlen or prefixlen > supernet.max_prefixlen:
+        raise ValueError("Can't carve /{} subnets out of {}".format(prefixlen, supernet))
+    slots = 2 ** (prefixlen - supernet.prefixlen)
+    if count > slots:
+        raise ValueError("{} only has room for {} /{} subnets, not {}".format(supernet, slots, prefixlen, count))
+    size = 2 ** (supernet.max_prefixlen - prefixlen)
+    base = supernet.network_address
+    return [ipaddress.ip_network((base + slot*size, prefixlen)) for slot in sample_offsets(slots, count, seeded_rng(seed))]
+
+
+def subnet_capacity(supernet='10.0.0.0/8', prefixlen=24):
+    """Returns how many hosts fit in a subnet of the given prefix length in supernet, as build_configs() places them:
+    its network address, first host and broadcast address are left out."""
+    return 2 ** (ipaddress.ip_network(supernet).max_prefixlen - prefixlen) - 3
+
+
+def default_maximum(capacity=252):
+    """Returns the default largest subnet for subnets that can hold capacity hosts: 150 of a /24, as much of smaller
+    ones."""
+    return max(3, min(150, capacity * 150 // 252))
+
+
+def default_minimum(maximum, capacity=252):
+    """Returns the default smallest subnet for subnets of up to maximum hosts, each able to hold capacity: as far
+    from full as maximum is from empty, and no more than 104 for every 150 of maximum."""
+    return max(0, min(capacity + 2 - maximum, maximum * 104 // 150))
+
+
+def assign_domains(subnets, domain, seed=None):
+    """Gives every subnet specification its own subdomain of domain (see generate_fqdn()), which becomes the
+    rDNS_domain of its hosts."""
+    rng = seeded_rng(seed)
+    domain = domain.rstrip('.')
+    taken = set()
+    for n in subnets:
+        subdomain = generate_fqdn(domain, 1, rng)
+        while subdomain in taken:
+            subdomain = generate_fqdn(domain, 1, rng)
+        taken.add(subdomain)
+        n['domain'] = subdomain
+    return subnets
+
+
+def build_configs(subnets, host_count, dev_div, domain=None, supernet='10.0.0.0/8', prefixlen=24, seed=None,
+                  instrument=None, oui=None):
+    """Returns a json object of subnet specifications, or None upon error. With a domain, every subnet gets its own
+    subdomain of it (see assign_domains()); with an OUI, every MAC starts with it."""
     global VERBOSE
+    rng = seeded_rng(seed)
+    instrument = instrument or Instrumentation()
     jsons = []              # subnet breakdown
     unlabeled_hosts = []    # number of hosts in the network w/o roles
-    ip_addr = []            # keeping track of the 2nd and 3rd octets in IP
     roles = dict.fromkeys(dev_div.keys(), 0)
 
-    if len(subnets)/254 > 254:
-        print("WARNING: You're about to see some really sick IPs. Have fun.")
+    try:
+        if oui:
+            _oui_prefix(oui)
+            if host_count > 2**24:
+                raise ValueError("OUI {} only has room for {} MACs".format(oui, 2**24))
+        with instrument.phase('subnet allocation'):
+            nets = allocate_subnets(len(subnets), supernet, prefixlen, rng)
+    except ValueError as e:
+        print("ERROR: {}".format(e))
+        return None
 
-    for n in subnets:
-        addy = (randint(0,253), randint(0,253))
-        while addy in ip_addr:
-            addy = (randint(0,253), randint(0,253))
-        ip_addr.append(addy)
+    for n, net in zip(subnets, nets):
+                            # the network address and its first host are reserved, and so is the broadcast address
+        if n > net.num_addresses - 3:
+            print("ERROR: {} hosts won't fit in a /{} subnet".format(n, prefixlen))
+            return None
         jsons.append({
-                    "start_ip"  : '10.{}.{}.2'.format(addy[0],addy[1]),
-                    "subnet"   : '10.{}.{}.0/24'.format(addy[0], addy[1]),
+                    "start_ip"  : str(net.network_address + 2),
+                    "subnet"   : str(net),
                     "hosts"     : n,
                     "roles"     : roles.copy()
                 })
+        if oui:
+            jsons[-1]['oui'] = oui
         unlabeled_hosts.append(n)
         if VERBOSE:
             print("start_ip: {}\t number of hosts: {}\t".format(jsons[-1]['start_ip'], jsons[-1]['hosts']))
 
     # divvy up the roles, now that the subnets are defined
-    labeled_hosts = 0
-    for dev in dev_div:
-        dev_total = dev_div[dev]
-        labeled_hosts += dev_total
-        while dev_total > 0:
-            while True:
-                n = randrange(0, len(subnets))
-                if (unlabeled_hosts[n] > 0):
-                    jsons[n]['roles'][dev] += 1
-                    unlabeled_hosts[n] -= 1
-                    break
-            dev_total -= 1
+    labeled_hosts = sum(dev_div.values())
+    with instrument.phase('role allocation'):
+        for n, counts in enumerate(allocate_roles(unlabeled_hosts, dev_div, rng)):
+            jsons[n]['roles'].update(counts)
+    if domain:
+        assign_domains(jsons, domain, rng)
     if labeled_hosts != host_count:
         print("WARNING: Labeled hosts ({}) didn't equal host count ({})".format(labeled_hosts, host_count))
 
@@ -209,7 +372,7 @@ def build_configs(subnets, host_count, dev_div, domain=None):
 
 
 
-def build_configs_deprecated(total, net_div, dev_div, domain=None):
+def build_configs_deprecated(total, net_div, dev_div, domain=None, seed=None):
     """Returns a json object of subnet specifications, or None upon error"""
     global VERBOSE
     total_subnets = calculate_subnets(total, net_div)
@@ -272,131 +435,2605 @@ def build_configs_deprecated(total, net_div, dev_div, domain=None):
     if DEBUG:
         print("DEBUG: host_counter = {}\ttotal subnets = {}".format(host_counter, total_subnets))
 
-    total_hosts = 0
-    for dev in dev_div:
-        ct = dev_div[dev]
-        total_hosts += ct
+    total_hosts = sum(dev_div.values())
+    for n, counts in enumerate(allocate_roles(host_counter, dev_div, seed)):
+        jsons[n]['roles'].update(counts)
         if (DEBUG):
-            print("DEBUG: dev = {}\tcount = {}\ttotal = {}\thost_counter = {}".format(dev, dev_div[dev], total_hosts, host_counter))
-        while ct > 0:
-            randomnet = randrange(0, total_subnets)
-            if host_counter[randomnet] > 0:
-                jsons[randomnet]['roles'][dev] += 1
-                host_counter[randomnet] -= 1
-                ct -= 1
+            print("DEBUG: subnet = {}\thosts = {}\troles = {}".format(n, host_counter[n], counts))
     if total_hosts != total:
         print("BUG: Number of devices in breakdown did not add up to {}".format(total))
+    if domain:
+        assign_domains(jsons, domain, seed)
 
     return jsons
 
 
-def randomize_subnet_breakdown(count, minimum, maximum):
+def randomize_subnet_breakdown(count, minimum, maximum, seed=None):
     '''Returns an array of host counts (where index = subnet), or None if the input is ridiculous.'''
-    subnets = []
-    nodes_left = count
+    rng = seeded_rng(seed)
 
-    # I mean, this is tested for very large values of count; I haven't tested very small numbers yet.
-    if count <= 0 or minimum > count or maximum > count or minimum < 0 or maximum < 0 or maximum <= minimum:
+    if count <= 0 or minimum < 0 or maximum <= 0 or maximum < minimum:
         return None
 
-                # break count into subnets until count = 0 or < min
-    while (nodes_left > 0):
-        clients = randint(minimum, maximum)
-        subnets.append(clients)
-        nodes_left -= clients
-        if DEBUG:
-            print("DEBUG: subnet count: {}\tnodes left: {}".format(clients, nodes_left))
-        if minimum < nodes_left < maximum:
-            subnets.append(nodes_left)
-            nodes_left = 0
-        elif nodes_left < minimum:
-            # i.e., if all the subnets are maxed out but don't add up to the requested count,
-            # then start all over again, cuz there won't be any way to honor min/max requirement.
-            if (len(subnets) * maximum < count):
-                subnets.clear()
-                nodes_left = count
-            else:
-                break
+                # the number of subnets that can honor min/max, closest to what the average subnet would give
+    fewest = -(-count // maximum)
+    most = count // minimum if minimum else count
+    if fewest > most:
+        return None
+    k = min(max(round(count * 2 / (minimum + maximum)), fewest), most)
 
-                # divvy up the rest of the nodes among the existing subnets
-    subnetIDs = [x for x in iter(range(len(subnets)))]
-    while (nodes_left > 0):
-        s = choice(subnetIDs) # pick a randum subnet
+                # every subnet starts at minimum; the rest is dealt out in one pass, each subnet drawing
+                # around the share it would need for the remainder to still fit in the subnets after it
+    spread = maximum - minimum
+    nodes_left = count - k * minimum
+    subnets = []
+    for i in range(k):
+        after = k - i - 1
+        share = nodes_left / (after + 1)
+        width = min(share, spread - share)
+        low = max(nodes_left - after * spread, math.floor(share - width))
+        high = min(nodes_left, math.ceil(share + width))
+        clients = rng.randint(low, high)
+        subnets.append(minimum + clients)
+        nodes_left -= clients
         if DEBUG:
-            print("DEBUG: looping with s={}, count={}, left={}".format(s, subnets[s], nodes_left))
-        if subnets[s] < maximum:
-            subnets[s] += 1
-            nodes_left -= 1
-        else:
-            subnetIDs.remove(s) 
+            print("DEBUG: subnet count: {}\tnodes left: {}".format(minimum + clients, nodes_left))
+    rng.shuffle(subnets)
     return subnets
 
 
+def sample_offsets(span, k, rng=None):
+    """Returns k unique random integers in [0, span), in random order; each costs constant expected time."""
+    rng = rng or _random
+    if k > span:
+        raise ValueError("Can't pick {} unique values out of {}".format(k, span))
+    if span <= sys.maxsize and k * 2 > span:
+        return rng.sample(range(span), k)
+                            # sparse (or astronomically large) space: rejection against a set
+    taken = set()
+    picks = []
+    while len(picks) < k:
+        x = rng.randrange(span)
+        if x not in taken:
+            taken.add(x)
+            picks.append(x)
+    return picks
 
-def build_network(subnets, fname=None, randomspace=False, prettyprint=True):
-    global VERBOSE
-    outobj = []
-    subnets_togo = len(subnets)
+
+def subnet_seed(seed, index):
+    """Derives the seed of subnet number index from a master seed, independently of every other subnet."""
+    digest = hashlib.sha256('{}:{}'.format(seed, index).encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+_MASK64 = 2**64 - 1
+
+
+def _mix64(x):
+    """Scrambles the low 64 bits of x (the splitmix64 finalizer)."""
+    x = (x + 0x9e3779b97f4a7c15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return x ^ (x >> 31)
+
+
+def permute(index, size, key):
+    """Returns where index lands in a pseudo-random shuffle of range(size) picked by key, without doing the shuffle.
+
+    This is a 4-round Feistel network over the smallest even number of bits covering size, walking the cycle until
+    it lands back inside range(size); that takes fewer than 4 steps on average. Each round multiplies its half by
+    the golden ratio (Fibonacci hashing) under a key of its own drawn from key, which is cheap enough in Python to run
+    several of these for every host."""
+    return _permute(index, size, _round_keys(key))
+
+
+@functools.lru_cache(maxsize=256)
+def _round_keys(key):
+    """The keys of the rounds of permute() and _square_permute() with key."""
+    return tuple(_mix64(key ^ (r << 60)) for r in range(4))
+
+
+def _permute(index, size, keys):
+    """permute() with its _round_keys() already worked out."""
+    if size <= 1:
+        return index
+    half = ((size - 1).bit_length() + 1) // 2
+    mask = (1 << half) - 1
+    shift = max(64 - half, 0)
+    x = index
+    while True:
+        left, right = x >> half, x & mask
+        for k in keys:
+            left, right = right, left ^ ((((k ^ right) * 0x9e3779b97f4a7c15) & 0xffffffffffffffff) >> shift)
+        x = (left << half) | right
+        if x < size:
+            return x
+
+
+def identity_key(seed):
+    """Derives the key that picks the MACs, UIDs and host names of a network from its master seed."""
+    return subnet_seed(seed, 'identity')
+
+
+@functools.lru_cache(maxsize=64)
+def _identity_keys(key):
+    """The round keys of the UUID and MAC permutations of a network whose identity_key() is key, and the key of its
+    host name permutations (which depends on the name's size too)."""
+    return _round_keys(_mix64(key ^ 3)), _round_keys(_mix64(key ^ 4)), _mix64(key ^ 5)
+
+
+@functools.lru_cache(maxsize=64)
+def _oui_prefix(oui):
+    """Returns the 24-bit number of an OUI written as 'xx:xx:xx' (or with dashes or nothing between)."""
+    digits = oui.replace(':', '').replace('-', '')
+    if len(digits) != 6 or digits.strip(string.hexdigits):
+        raise ValueError("{} isn't an OUI".format(oui))
+    return int(digits, 16)
+
+
+def unique_mac(index, key, oui=None):
+    """Returns MAC number index of a network whose identity_key() is key; no two indexes share one.
+
+    Without an OUI, MACs are locally administered unicast addresses; with one, they're the 2**24 MACs that start
+    with it."""
+    return _mac(index, _identity_keys(key)[1], oui)
+
+
+def _mac(index, key, oui):
+    """unique_mac() with the MAC key of _identity_keys() already worked out."""
+    if oui:
+        if index >= 2**24:
+            raise ValueError("OUI {} only has room for {} MACs".format(oui, 2**24))
+        mac = (_oui_prefix(oui) << 24) | _permute(index, 2**24, key)
+    else:
+        x = _permute(index, 2**46, key)
+        mac = ((x >> 40) << 42) | (2 << 40) | (x & (2**40 - 1))
+    return mac.to_bytes(6, 'big').hex(':')
+
+
+def unique_uuid(index, key):
+    """Returns the version 4 UUID number index of a network whose identity_key() is key; no two indexes share one."""
+    return _uuid(index, _identity_keys(key)[0])
+
+
+def _uuid(index, key):
+    """unique_uuid() with the UUID key of _identity_keys() already worked out; formats like str(uuid.UUID())."""
+    x = _permute(index, 2**122, key)
+    h = '%032x' % (((x >> 74) << 80) | (4 << 76) | (((x >> 62) & 0xfff) << 64) | (2 << 62) | (x & (2**62 - 1)))
+    return '{}-{}-{}-{}-{}'.format(h[:8], h[8:12], h[12:16], h[16:20], h[20:])
+
+
+def _square_permute(index, base, key):
+    """Shuffles [0, base**2) by key with four Feistel rounds whose halves are digits in base, so that (unlike
+    permute()) no size needs any walking."""
+    left, right = divmod(index, base)
+    for k in _round_keys(key):
+        left, right = right, (left + ((((k ^ right) * 0x9e3779b97f4a7c15) & 0xffffffffffffffff) >> 32)) % base
+    return left * base + right
+
+
+def unique_hostname(index, key, size):
+    """Returns host name number index of a network whose identity_key() is key, size characters long (or longer, once
+    there are no names of that size left for index); no two indexes share one."""
+    return _hostname(index, _identity_keys(key)[2], size)
+
+
+def _hostname(index, key, size):
+    """unique_hostname() with the host name key of _identity_keys() already worked out."""
+    base = len(_HOSTNAME_CHARS)
+    while base ** size <= index:
+        size += 1
+    x = _square_permute(index, 6 ** size, key ^ size)
+    name = []
+    for _ in range(size):
+        x, c = divmod(x, base)
+        name.append(_HOSTNAME_CHARS[c])
+    return ''.join(name)
+
+
+def _address_span(n, start_ip):
+    """Returns how many addresses of subnet n there are from start_ip up to (not including) the broadcast address,
+    which has every host bit of start_ip set."""
+    hostbits = start_ip.max_prefixlen - int(n['subnet'].rpartition('/')[2])
+    return (int(start_ip) | ((1 << hostbits) - 1)) - int(start_ip)
+
+
+def _subnet_layout(n, randomspace, first=0, idkey=0):
+    """Returns what every host of subnet n needs to know about it: first IP, random address span (0 for sequential
+    addresses), role boundaries, and the network-wide index of its first host along with the network's
+    identity_key()."""
+    start_ip = ipaddress.ip_address(n['start_ip'])
+    span = 0
+    if (randomspace):
+        span = _address_span(n, start_ip)
+        if n['hosts'] > span:
+            raise ValueError("{} hosts won't fit in {}".format(n['hosts'], n['subnet']))
+    roles = []
+    bound = 0
+    for role, ct in n['roles'].items():
+        if ct > 0:
+            bound += ct
+            roles.append((bound, role))
+    return start_ip, span, roles, first, idkey
+
+
+def _fingerprint(a_role, rng):
+    """Returns the role and OS fingerprints of a host whose actual role is a_role."""
+    role = {
+        'role': a_role,
+        'confidence': rng.randrange(55,100)
+    }
+
+    os = { 'os': generate_os_type(a_role, rng) }
+    if os['os'] != 'Unknown':
+        os['confidence'] = rng.randrange(55,100)
+    return role, os
+
+
+def _host_draws(index, idkey):
+    """Returns the two 64-bit hashes that the name length, record source and fingerprints of host number index of a
+    network whose identity_key() is idkey are cut from; hashing the index is much cheaper than seeding a random
+    generator for every host."""
+    h = _mix64(idkey ^ (6 << 60) ^ index)
+    return h, _mix64(h)
+
+
+def _make_host(n, a_role, ip, index, idkey, timestamp=None):
+    """Returns the description of host number index of the network, in subnet n with role a_role at address ip (a
+    string); its identifiers are unique to index, and the rest is cut from its _host_draws()."""
+    h, g = _host_draws(index, idkey)
+    ukey, mkey, hkey = _identity_keys(idkey)
+    host = {
+        'uid':_uuid(index, ukey),
+        'mac':_mac(index, mkey, n.get('oui')),
+        'rDNS_host':_hostname(index, hkey, 4 + ((h & 0xffffffff) * 5 >> 32)),
+        'subnet':n['subnet']
+    }
+
+    if 'domain' in n:
+        host['rDNS_domain'] = n['domain']
+
+    host['record'] = {
+        'source':RECORD_SOURCES[(h >> 32) * len(RECORD_SOURCES) >> 32],
+        'timestamp': timestamp or str(dt.now())
+    }
+
+    host['role'] = {
+        'role': a_role,
+        'confidence': 55 + ((g & 0xffffffff) * 45 >> 32)
+    }
+    oses = OS_TYPES.get(a_role, ['Unknown'])
+    host['os'] = { 'os': oses[((g >> 32) & 0xffff) * len(oses) >> 16] }
+    if host['os']['os'] != 'Unknown':
+        host['os']['confidence'] = 55 + ((g >> 48) * 45 >> 16)
+    host['IP'] = ip
+    return host
+
+
+def _build_host(n, layout, key, i, timestamp=None):
+    """Returns host number i of subnet n, whose seed is key; it only depends on those, never on the hosts before it.
+
+    The host's identifiers, role and (random) IP are picked by keyed permutations of its index, the subnet's role
+    slots and address offsets, and the rest is hashed from its index."""
+    start_ip, span, roles, first, idkey = layout
+    slot_key, ip_key = _subnet_keys(key)
+    slot = _permute(i, n['hosts'], slot_key)
+    a_role = next((role for bound, role in roles if slot < bound), 'Unknown')
+
+    if (span):
+        offset = _permute(i, span, ip_key)
+    else:
+        offset = n['hosts'] - 1 - i
+    if start_ip.version == 4:
+        ip = '{}.{}.{}.{}'.format(*(int(start_ip) + offset).to_bytes(4, 'big'))
+    else:
+        ip = str(start_ip + offset)
+    return _make_host(n, a_role, ip, first + i, idkey, timestamp)
+
+
+@functools.lru_cache(maxsize=64)
+def _subnet_keys(key):
+    """The round keys of the role slot and address permutations of a subnet whose seed is key."""
+    return _round_keys(_mix64(key ^ 1)), _round_keys(_mix64(key ^ 2))
+
+
+def _build_subnet(n, randomspace=False, key=0, timestamp=None, first=0, idkey=0):
+    """Yields the host descriptions for a single subnet specification, whose seed is key and whose first host is
+    host number first of a network whose identity_key() is idkey."""
+    layout = _subnet_layout(n, randomspace, first, idkey)
+    for i in range(n['hosts']):
+        yield _build_host(n, layout, key, i, timestamp)
+
+
+def subnet_offsets(subnets):
+    """Returns the position of each subnet's first host in the network, followed by the total number of hosts."""
+    offsets = [0]
     for n in subnets:
-        start_ip = ipaddress.ip_address(n['start_ip'])
-        role_ct = dict(n['roles'])
-        hosts_togo = n['hosts']
-        ip_taken = []
-        subnets_togo -= 1
-
-        while (hosts_togo > 0):
-            host = {
-                'uid':generate_uuid(),
-                'mac':generate_mac(),
-                'rDNS_host':randstring(randrange(4,9)),
-                'subnet':n['subnet']
+        offsets.append(offsets[-1] + n['hosts'])
+    return offsets
+
+
+def host_at(subnets, index, seed, randomspace=False, timestamp=None, offsets=None):
+    """Returns host number index of the network that build_network(subnets, seed=seed) makes, without generating the
+    hosts before it. Pass offsets from subnet_offsets() to skip recomputing them on every lookup."""
+    if offsets is None:
+        offsets = subnet_offsets(subnets)
+    if index < 0 or index >= offsets[-1]:
+        raise IndexError("host index {} out of range".format(index))
+    s = bisect.bisect_right(offsets, index) - 1
+    n = subnets[s]
+    layout = _subnet_layout(n, randomspace, offsets[s], identity_key(seed))
+    return _build_host(n, layout, subnet_seed(seed, s), index - offsets[s], timestamp)
+
+
+
+CHURN_RATES = {
+    'join': 0.02,           # hosts joining the network, as a fraction of the live hosts per hour
+    'leave': 0.02,          # hosts leaving it
+    'dhcp': 0.05,           # hosts moving to another address of their subnet
+    'fingerprint': 0.1      # hosts seen again, with a new record and role/OS fingerprints
+}
+
+
+def plan_from_hosts(hosts):
+    """Returns subnet specifications, like the ones build_configs() makes, that account for the given hosts."""
+    plans = {}
+    for host in hosts:
+        n = plans.get(host['subnet'])
+        if n is None:
+            net = ipaddress.ip_network(host['subnet'])
+            n = plans[host['subnet']] = {
+                "start_ip"  : str(net.network_address + 2),
+                "subnet"    : host['subnet'],
+                "hosts"     : 0,
+                "roles"     : {}
             }
+            if 'rDNS_domain' in host:
+                n['domain'] = host['rDNS_domain']
+        n['hosts'] += 1
+        role = host['role']['role']
+        n['roles'][role] = n['roles'].get(role, 0) + 1
+    return list(plans.values())
+
+
+class _Fenwick(object):
+    """Running totals over a list of counts, each updated and searched in logarithmic time."""
+
+    def __init__(self, counts):
+        self.tree = [0] + list(counts)
+        self.total = sum(self.tree)
+        for i in range(1, len(self.tree)):
+            j = i + (i & -i)
+            if j < len(self.tree):
+                self.tree[j] += self.tree[i]
+
+    def add(self, index, delta):
+        self.total += delta
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """Returns the index of the count that position value of the running total falls in."""
+        i = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if i + step < len(self.tree) and self.tree[i + step] <= value:
+                i += step
+                value -= self.tree[i]
+            step >>= 1
+        return i
+
+
+class NetworkEvolution(object):
+    """Evolves a network over time as a stream of timestamped add/remove/modify events.
+
+    The network is either the one build_network(subnets, seed=seed, randomspace=randomspace) makes, in which case its
+    hosts are only generated when an event touches them, or the given hosts (subnets are then worked out from them if
+    need be). Each subnet only counts the hosts build_network() made that no event has touched yet, as the first
+    positions of a lazy shuffle (holding just the numbers swapped out of place), keeps the others in a list that hosts
+    are swap-removed from, and keeps its released addresses in a pool that new and moved hosts draw from before the
+    unused part of the subnet's address permutation (skipping the addresses of given hosts), so neither starting nor
+    a step takes time in proportion to the size of the network or its address space."""
+
+    def __init__(self, subnets=None, seed=None, randomspace=False, timestamp=None, hosts=None, rates=None,
+                 start=None):
+        if hosts is not None:
+            hosts = [dict(host) for host in hosts]
+            if subnets is None:
+                subnets = plan_from_hosts(hosts)
+        if seed is None:
+            seed = _random.getrandbits(64)
+        self.subnets = subnets
+        self.randomspace = randomspace
+        self.timestamp = timestamp
+        self.rates = dict(CHURN_RATES, **(rates or {}))
+        self.clock = start or dt.now()
+        self.rng = _random.Random(subnet_seed(seed, 'churn'))
+        self.events = {'join': self._join, 'leave': self._leave, 'dhcp': self._dhcp, 'fingerprint': self._refingerprint}
+        for kind in self.rates:
+            if kind not in self.events:
+                raise ValueError("Unknown churn rate '{}'".format(kind))
+
+        self.keys = [subnet_seed(seed, s) for s in range(len(subnets))]
+        self.idkey = identity_key(seed)
+        offsets = subnet_offsets(subnets)
+        self.layouts = [_subnet_layout(n, randomspace, offsets[s], self.idkey) for s, n in enumerate(subnets)]
+        self.spans = [_address_span(n, layout[0]) for n, layout in zip(subnets, self.layouts)]
+        self.indexes = max(offsets[-1], len(hosts or []))   # counter of the next host to join the network
+        self.live = [[] for n in subnets]
+        self.swapped = {}   # (subnet, position): host number, where a lazy shuffle moved one
+        if hosts is None:
+                            # hosts are numbered as build_network() makes them, and so are their addresses
+            self.untouched = [n['hosts'] for n in subnets]
+            self.walked = [n['hosts'] for n in subnets]
+            self.used = [set() for n in subnets]
+        else:
+                            # the walk through each subnet's addresses starts over, stepping past the given hosts'
+            index = {n['subnet']: s for s, n in enumerate(subnets)}
+            self.untouched = [0 for n in subnets]
+            self.walked = [0 for n in subnets]
+            self.used = [set() for n in subnets]
+            for host in hosts:
+                s = index.get(host['subnet'])
+                if s is None:
+                    raise ValueError("Host {} isn't in any of the subnets".format(host['uid']))
+                self.live[s].append(host)
+                offset = self._offset(s, host)
+                if self._walkable(s, offset):
+                    self.used[s].add(offset)
+        self.free = [[] for n in subnets]
+        self.population = _Fenwick(self.untouched[s] + len(live) for s, live in enumerate(self.live))
+        self.room = _Fenwick(self._room(s) for s in range(len(subnets)))
+
+    def __len__(self):
+        return self.population.total
+
+    def __iter__(self):
+        """Yields the description of every live host."""
+        for s, live in enumerate(self.live):
+            for p in range(self.untouched[s]):
+                yield _build_host(self.subnets[s], self.layouts[s], self.keys[s], self.swapped.get((s, p), p),
+                                  self.timestamp)
+            yield from live
+
+    def _walkable(self, s, offset):
+        return 0 <= offset < self.spans[s]
+
+    def _room(self, s):
+        return len(self.free[s]) + self.spans[s] - self.walked[s] - len(self.used[s])
+
+    def _offset(self, s, host):
+        return int(ipaddress.ip_address(host['IP'])) - int(self.layouts[s][0])
+
+    def _next_offset(self, s):
+        """Takes a free address offset of subnet s: a released one, or else the next one build_network() didn't use
+        that no given host has."""
+        free = self.free[s]
+        if free:
+            p = self.rng.randrange(len(free))
+            free[p], free[-1] = free[-1], free[p]
+            return free.pop()
+        used = self.used[s]
+        while True:
+            j = self.walked[s]
+            self.walked[s] += 1
+            offset = permute(j, self.spans[s], _mix64(self.keys[s] ^ 2)) if self.randomspace else j
+            if offset not in used:
+                return offset
+            used.remove(offset)
+
+    def _release(self, s, offset):
+        if offset in self.used[s]:
+            self.used[s].remove(offset)     # the walk will get to it
+        elif self._walkable(s, offset):
+            self.free[s].append(offset)
+
+    def _pick(self):
+        """Returns the subnet and position in its list of a live host picked uniformly at random, generating it (and
+        moving it to the list) if no event has touched it yet."""
+        s = self.population.find(self.rng.randrange(self.population.total))
+        p = self.rng.randrange(self.untouched[s] + len(self.live[s]))
+        untouched = self.untouched[s]
+        if p >= untouched:
+            p -= untouched
+            return s, p, self.live[s][p]
+                            # swap the last untouched host into its position, as a Fisher-Yates shuffle would
+        index = self.swapped.pop((s, p), p)
+        last = self.swapped.pop((s, untouched - 1), untouched - 1)
+        if p < untouched - 1:
+            self.swapped[s, p] = last
+        self.untouched[s] -= 1
+        host = _build_host(self.subnets[s], self.layouts[s], self.keys[s], index, self.timestamp)
+        self.live[s].append(host)
+        return s, len(self.live[s]) - 1, host
+
+    def _join(self, timestamp):
+        if not self.room.total:
+            return None
+        s = self.room.find(self.rng.randrange(self.room.total))
+        n = self.subnets[s]
+        start_ip, span, roles, first, idkey = self.layouts[s]
+        slot = self.rng.randrange(n['hosts']) if n['hosts'] else 0
+        a_role = next((role for bound, role in roles if slot < bound), 'Unknown')
+        host = _make_host(n, a_role, str(start_ip + self._next_offset(s)), self.indexes, idkey, timestamp)
+        self.indexes += 1
+        self.live[s].append(host)
+        self.population.add(s, 1)
+        self.room.add(s, -1)
+        return {'event': 'add', 'timestamp': timestamp, 'host': dict(host)}
+
+    def _leave(self, timestamp):
+        if not self.population.total:
+            return None
+        s, p, host = self._pick()
+        live = self.live[s]
+        live[p] = live[-1]
+        live.pop()
+        self._release(s, self._offset(s, host))
+        self.population.add(s, -1)
+        self.room.add(s, 1)
+        return {'event': 'remove', 'timestamp': timestamp, 'uid': host['uid'], 'subnet': host['subnet'],
+                'IP': host['IP']}
+
+    def _dhcp(self, timestamp):
+        if not self.population.total:
+            return None
+        s, p, host = self._pick()
+        if not self._room(s):
+            return None
+        offset = self._offset(s, host)
+        host['IP'] = str(self.layouts[s][0] + self._next_offset(s))
+        self._release(s, offset)
+        return {'event': 'modify', 'timestamp': timestamp, 'uid': host['uid'], 'changes': {'IP': host['IP']}}
+
+    def _refingerprint(self, timestamp):
+        if not self.population.total:
+            return None
+        s, p, host = self._pick()
+        host['record'] = {'source': record(rng=self.rng), 'timestamp': timestamp}
+        host['role'], host['os'] = _fingerprint(host['role']['role'], self.rng)
+        changes = {key: host[key] for key in ('record', 'role', 'os')}
+        return {'event': 'modify', 'timestamp': timestamp, 'uid': host['uid'], 'changes': changes}
+
+    def step(self, seconds=3600):
+        """Returns the events of the next seconds of the network's life, in the order they happen."""
+        kinds = []
+        for kind, rate in sorted(self.rates.items()):
+            expected = rate * self.population.total * seconds / 3600
+            kinds.extend([kind] * (int(expected) + (self.rng.random() < expected % 1)))
+        self.rng.shuffle(kinds)
+        offsets = sorted(self.rng.uniform(0, seconds) for _ in kinds)
+
+        events = []
+        for kind, offset in zip(kinds, offsets):
+            event = self.events[kind](str(self.clock + timedelta(seconds=offset)))
+            if event is not None:
+                events.append(event)
+        self.clock += timedelta(seconds=seconds)
+        return events
+
+    def evolve(self, steps, seconds=3600):
+        """Yields the events of the given number of steps of seconds each."""
+        for _ in range(steps):
+            for event in self.step(seconds):
+                yield event
+
+
+ENGINES = ['python', 'numpy']
+
+_HEXDIGITS = b'0123456789abcdef'
+_HOSTCHARS = (string.ascii_lowercase + string.digits).encode()
+_HOSTNAME_CHARS = string.ascii_lowercase + string.digits
+_OCTETS = [str(i) for i in range(256)]
+
+
+def _hex_column(octets, groups, sep):
+    """Formats each row of a uint8 matrix as hex digits, with sep between the given groups of bytes."""
+    hexdigits = np.frombuffer(_HEXDIGITS, dtype=np.uint8)
+    rows, width = octets.shape
+    w = width * 2 + len(groups) - 1
+                            # column of each byte's first digit, skipping over the separators
+    pos = np.arange(width) * 2 + np.repeat(np.arange(len(groups)), groups)
+    chars = np.full((rows, w + 1), ord(sep), dtype=np.uint8)
+    chars[:, pos] = hexdigits[octets >> 4]
+    chars[:, pos + 1] = hexdigits[octets & 0x0f]
+    chars[:, w] = ord('\n')     # splitting the rows apart is cheaper than slicing them out
+    return chars.tobytes().decode('ascii').split('\n')[:-1]
+
+
+def _np_mix64(x):
+    """_mix64() of every element of a uint64 array."""
+    x = x + np.uint64(0x9e3779b97f4a7c15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def _np_feistel(left, right, half, keys):
+    """The rounds of permute() over arrays of left and right halves, of half bits each, under the _round_keys() in
+    keys (half and each key being either a number or an array)."""
+    shift = np.uint64(64) - np.asarray(half, dtype=np.uint64)
+    for k in keys:
+        k = np.asarray(k, dtype=np.uint64)
+        left, right = right, left ^ (((k ^ right) * np.uint64(0x9e3779b97f4a7c15)) >> shift)
+    return left, right
+
+
+def _np_square_permute(index, base, key):
+    """_square_permute() of every element of a uint64 array, with a base and a key for each."""
+    left, right = index // base, index % base
+    for r in range(4):
+        k = _np_mix64(key ^ np.uint64(r << 60))
+        left, right = right, (left + (((k ^ right) * np.uint64(0x9e3779b97f4a7c15)) >> np.uint64(32))) % base
+    return left * base + right
+
+
+def _np_identities(index, idkey, oui=None):
+    """Returns the UUID, MAC and host name that _make_host() gives every element of an array of host indexes, as a
+    (hosts, 16) uint8 matrix, a (hosts, 6) one and a list."""
+    k = len(index)
+    if oui and k and int(index[-1]) >= 2**24:
+        raise ValueError("OUI {} only has room for {} MACs".format(oui, 2**24))
+                            # both MAC spaces have an even number of bits, so permute() never walks in them, and the
+                            # UUIDs and MACs can share the rounds
+    half = 12 if oui else 23
+    left, right = _np_feistel(np.concatenate([np.zeros(k, dtype=np.uint64), index >> np.uint64(half)]),
+                              np.concatenate([index, index & np.uint64((1 << half) - 1)]),
+                              np.repeat(np.array([61, half], dtype=np.uint64), k),
+                              [np.repeat(np.array(rkeys, dtype=np.uint64), k)
+                               for rkeys in zip(*_identity_keys(idkey)[:2])])
+    x = (left[k:] << np.uint64(half)) | right[k:]
+    left, right = left[:k], right[:k]
+    hi = ((left >> np.uint64(13)) << np.uint64(16)) | np.uint64(0x4000) | ((left >> np.uint64(1)) & np.uint64(0xfff))
+    lo = np.uint64(2 << 62) | ((left & np.uint64(1)) << np.uint64(61)) | right
+    uids = np.stack([hi, lo], axis=1).astype('>u8').view(np.uint8).reshape(k, 16)
+
+    if oui:
+        macs = np.uint64(_oui_prefix(oui) << 24) | x
+    else:
+        macs = ((x >> np.uint64(40)) << np.uint64(42)) | np.uint64(2 << 40) | (x & np.uint64(2**40 - 1))
+    macs = macs.astype('>u8').view(np.uint8).reshape(k, 8)[:, 2:]
+
+    draws = _np_mix64(np.uint64(idkey ^ (6 << 60)) ^ index)
+    namelens = (4 + ((draws & np.uint64(0xffffffff)) * np.uint64(5) >> np.uint64(32))).astype(np.int64)
+                            # names longer than asked for once there are none of that size left for the index
+    base = len(_HOSTCHARS)
+    if k and int(index[-1]) >= base ** int(namelens.min()):
+        for size in range(1, 12):
+            namelens = np.maximum(namelens, np.where(index >= np.uint64(base ** size), size + 1, 0))
+    sizes = namelens.astype(np.uint64)
+    x = _np_square_permute(index, np.uint64(6) ** sizes, np.uint64(_identity_keys(idkey)[2]) ^ sizes)
+    width = int(namelens.max(initial=1))
+    names = np.zeros((k, width + 1), dtype=np.uint8)
+    chars = np.frombuffer(_HOSTCHARS, dtype=np.uint8)
+    for c in range(width):
+        names[:, c] = np.where(c < namelens, chars[(x % np.uint64(base)).astype(np.int64)], 0)
+        x = x // np.uint64(base)
+    names[:, width] = ord('\n')  # as in _hex_column(), with the padding past each name dropped first
+    return uids, macs, names.tobytes().decode('ascii').replace('\0', '').split('\n')[:-1]
+
+
+_NP_BLOCK = 4096
+
+
+@functools.lru_cache(maxsize=2)
+def _np_identity_block(block, idkey, oui):
+    """The UUIDs, MACs and host names, as strings, of host numbers [block, block + 1) * _NP_BLOCK of a network whose
+    identity_key() is idkey; they're worked out a block at a time because NumPy's overhead per call would swamp its
+    cost per host on arrays of one subnet's size."""
+    uids, macs, names = _np_identities(np.arange(block * _NP_BLOCK, (block + 1) * _NP_BLOCK, dtype=np.uint64), idkey,
+                                       oui)
+    return _hex_column(uids, (4, 2, 2, 2, 6), '-'), _hex_column(macs, (1, 1, 1, 1, 1, 1), ':'), names
+
+
+@functools.lru_cache(maxsize=64)
+def _np_os_table(roles):
+    """Returns the sorted OSes that hosts with the given roles (a tuple) can have, a table of the codes of each role's
+    OSes (padded out with its first) and the number of OSes of each role."""
+    oses = sorted({o for r in roles for o in OS_TYPES.get(r, ['Unknown'])})
+    choices = [[oses.index(o) for o in OS_TYPES.get(r, ['Unknown'])] for r in roles]
+    width = max((len(c) for c in choices), default=1)
+    os_table = np.array([c + c[:1] * (width - len(c)) for c in choices] or [[0]], dtype=np.int64)
+    os_counts = np.array([len(c) for c in choices] or [1])
+    return oses, os_table, os_counts
+
+
+def _numpy_subnet(n, randomspace=False, rng=None, timestamp=None, first=0, idkey=0):
+    """Returns the hosts of a subnet as columns, generated in one batch with NumPy; its first host is host number
+    first of a network whose identity_key() is idkey."""
+    if np is None:
+        raise ImportError("the numpy engine needs NumPy installed")
+    if rng is None:
+        rng = np.random.default_rng()
+    k = n['hosts']
+    counts = {r: ct for r, ct in n['roles'].items() if ct > 0}
+    unlabeled = k - sum(counts.values())
+    if unlabeled > 0:           # slots no role was dealt to are Unknown, as in _build_host()
+        counts['Unknown'] = counts.get('Unknown', 0) + unlabeled
+    roles = list(counts)
+    oses, os_table, os_counts = _np_os_table(tuple(roles))
+
+    uids, macs, names = [], [], []
+    for block in range(first // _NP_BLOCK, (first + k - 1) // _NP_BLOCK + 1):
+        start = block * _NP_BLOCK
+        for column, ids in zip((uids, macs, names), _np_identity_block(block, idkey, n.get('oui'))):
+            column += ids[max(first - start, 0):first + k - start]
+
+                            # roles are dealt out in a random order; each picks its OS from its own list
+    role_codes = rng.permutation(np.repeat(np.arange(len(roles)), list(counts.values())))
+    picks = (rng.random(len(role_codes)) * os_counts[role_codes]).astype(np.int64)
+    os_codes = os_table[role_codes, picks]
+
+    start_ip = ipaddress.ip_address(n['start_ip'])
+    if randomspace:
+        span = _address_span(n, start_ip)
+        if span < 2**63:
+            offsets = rng.choice(span, k, replace=False).tolist()
+        else:
+            offsets = sample_offsets(span, k, _random.Random(int(rng.integers(2**63))))
+    else:
+        span = k
+        offsets = range(k - 1, -1, -1)
+    low = int(start_ip) & 0xff
+    if start_ip.version == 4 and low + span <= 256:
+                            # the whole subnet shares its first three octets
+        prefix = n['start_ip'][:n['start_ip'].rindex('.') + 1]
+        ip_strs = [prefix + _OCTETS[low + o] for o in offsets]
+    elif start_ip.version == 4:
+        ips = np.array(offsets, dtype=np.uint64) + int(start_ip)
+        prefixes = {}
+        for hi in np.unique(ips >> 8).tolist():
+            prefixes[hi] = str(ipaddress.IPv4Address(hi << 8))[:-1]
+        ip_strs = [prefixes[hi] + _OCTETS[lo] for hi, lo in zip((ips >> 8).tolist(), (ips & 0xff).tolist())]
+    else:
+        ip_strs = [str(start_ip + o) for o in offsets]
+
+    return {
+        'uid': uids,
+        'mac': macs,
+        'rDNS_host': names,
+        'source': rng.integers(0, len(RECORD_SOURCES), k).tolist(),
+        'timestamp': timestamp or str(dt.now()),
+        'role': role_codes.tolist(),
+        'role_confidence': rng.integers(55, 100, k).tolist(),
+        'os': os_codes.tolist(),
+        'os_confidence': rng.integers(55, 100, k).tolist(),
+        'IP': ip_strs,
+        'roles': roles,
+        'oses': oses
+    }
 
-            if 'domain' in n:
-                host['rDNS_domain'] = n['domain']
 
-            host['record'] = {
-                'source':record(),
-                'timestamp': str(dt.now())
+def _numpy_rows(n, cols):
+    """Yields the host descriptions held in the columns made by _numpy_subnet()."""
+    for i, uid in enumerate(cols['uid']):
+        host = {
+            'uid': uid,
+            'mac': cols['mac'][i],
+            'rDNS_host': cols['rDNS_host'][i],
+            'subnet': n['subnet']
+        }
+        if 'domain' in n:
+            host['rDNS_domain'] = n['domain']
+        host['record'] = {
+            'source': RECORD_SOURCES[cols['source'][i]],
+            'timestamp': cols['timestamp']
+        }
+        host['role'] = {
+            'role': cols['roles'][cols['role'][i]],
+            'confidence': cols['role_confidence'][i]
+        }
+        host['os'] = { 'os': cols['oses'][cols['os'][i]] }
+        if host['os']['os'] != 'Unknown':
+            host['os']['confidence'] = cols['os_confidence'][i]
+        host['IP'] = cols['IP'][i]
+        yield host
+
+
+_TEMPLATES = {}
+
+
+def _host_template(indent, with_domain):
+    """Returns the text of one encoded host, made by running a placeholder host through _encode_hosts(), as the
+    pieces between its uid, mac, rDNS_host, source, role, OS and IP fields, along with what comes between its role
+    and the role's confidence and between its OS and the OS's confidence (those pairs each being one field)."""
+    key = (indent, with_domain)
+    if key not in _TEMPLATES:
+        fields = ['uid', 'mac', 'rDNS_host', 'subnet']
+        if with_domain:
+            fields.append('rDNS_domain')
+        h = {f: '\x01' + f for f in fields}
+        h['record'] = {'source': '\x01source', 'timestamp': '\x01timestamp'}
+        h['role'] = {'role': '\x01role', 'confidence': '\x01rconf'}
+        h['os'] = {'os': '\x01os', 'confidence': '\x01oconf'}
+        h['IP'] = '\x01IP'
+        t = _encode_hosts([h], indent)[0]
+        seps = []
+        for field, conf in (('role', 'rconf'), ('os', 'oconf')):
+            head, rest = t.split('"\\u0001{}"'.format(field))
+            sep, tail = rest.split('"\\u0001{}"'.format(conf))
+            t = head + '"\\u0001{}"'.format(field) + tail
+            seps.append(sep)
+        pieces = [t]
+        for field in ('uid', 'mac', 'rDNS_host', 'source', 'role', 'os', 'IP'):
+            quote = '"' if field in ('uid', 'mac', 'rDNS_host', 'IP') else ''
+            head, tail = pieces.pop().split('"\\u0001{}"'.format(field))
+            pieces += [head + quote, quote + tail]
+        _TEMPLATES[key] = (pieces, seps[0], seps[1])
+    return _TEMPLATES[key]
+
+
+@functools.lru_cache(maxsize=256)
+def _confidence_fields(value, sep):
+    """The fields of a role or OS (as it's encoded) with each confidence from 0 to 99 after sep."""
+    return [value + sep + str(c) for c in range(100)]
+
+
+def _numpy_encode(n, cols, indent):
+    """Encodes the rows of the columns made by _numpy_subnet() the way _encode_hosts() would encode them."""
+    pieces, role_sep, os_sep = _host_template(indent, 'domain' in n)
+    fixed = [('"\\u0001subnet"', json.dumps(n['subnet'])), ('"\\u0001timestamp"', json.dumps(cols['timestamp'])),
+             ('"\\u0001rDNS_domain"', json.dumps(n.get('domain')))]
+    for marker, value in fixed:
+        pieces = [p.replace(marker, value) for p in pieces]
+    p0, p1, p2, p3, p4, p5, p6, p7 = pieces
+    sources = [json.dumps(src) for src in RECORD_SOURCES]
+    roles = [_confidence_fields(json.dumps(r), role_sep) for r in cols['roles']]
+                            # hosts with an Unknown OS have no OS confidence
+    oses = [[json.dumps(o)] * 100 if o == 'Unknown' else _confidence_fields(json.dumps(o), os_sep)
+            for o in cols['oses']]
+                            # joining the pieces is several times cheaper than %-formatting a template this long
+    return [''.join((p0, uid, p1, mac, p2, name, p3, sources[src], p4, roles[r][rc], p5, oses[o][oc], p6, ip, p7))
+            for uid, mac, name, src, r, rc, o, oc, ip in zip(cols['uid'], cols['mac'], cols['rDNS_host'],
+                                                             cols['source'], cols['role'], cols['role_confidence'],
+                                                             cols['os'], cols['os_confidence'], cols['IP'])]
+
+
+def _csv_fields(values):
+    """Returns each value as csv.writer() writes it among others in a row."""
+    fields = []
+    for value in values:
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator='').writerow([value])
+        fields.append(buf.getvalue() if value != '' else '')
+    return fields
+
+
+def _numpy_csv(n, cols):
+    """Encodes the rows of the columns made by _numpy_subnet() as the CSV lines _encode_csv() would make of them."""
+    domain, subnet, stamp = _csv_fields([n.get('domain', ''), n['subnet'], cols['timestamp']])
+    middle = ',{},{},'.format(domain, subnet)
+    stamp = ',{},'.format(stamp)
+    sources = _csv_fields(RECORD_SOURCES)
+    roles = [_confidence_fields(r, ',') for r in _csv_fields(cols['roles'])]
+    oses = [['Unknown,'] * 100 if o == 'Unknown' else _confidence_fields(f, ',')
+            for o, f in zip(cols['oses'], _csv_fields(cols['oses']))]
+    return ''.join([''.join((uid, ',', mac, ',', name, middle, ip, ',', sources[src], stamp, roles[r][rc], ',',
+                             oses[o][oc], '\n'))
+                    for uid, mac, name, src, r, rc, o, oc, ip in zip(cols['uid'], cols['mac'], cols['rDNS_host'],
+                                                                     cols['source'], cols['role'],
+                                                                     cols['role_confidence'], cols['os'],
+                                                                     cols['os_confidence'], cols['IP'])])
+
+
+FORMATS = ['json', 'ndjson', 'csv']
+COMPRESSIONS = ['gzip', 'zstd']
+EXTENSIONS = {'json': '.json', 'ndjson': '.ndjson', 'csv': '.csv', 'columnar': '.gsnc', 'gzip': '.gz', 'zstd': '.zst'}
+
+CSV_FIELDS = ['uid', 'mac', 'rDNS_host', 'rDNS_domain', 'subnet', 'IP', 'source', 'timestamp',
+              'role', 'role_confidence', 'os', 'os_confidence']
+
+
+def _csv_row(host):
+    return [host['uid'], host['mac'], host['rDNS_host'], host.get('rDNS_domain', ''), host['subnet'], host['IP'],
+            host['record']['source'], host['record']['timestamp'], host['role']['role'], host['role']['confidence'],
+            host['os']['os'], host['os'].get('confidence', '')]
+
+
+def _encode_csv(hosts):
+    """Encodes hosts as CSV lines with the columns of CSV_FIELDS."""
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator='\n').writerows(_csv_row(h) for h in hosts)
+    return buf.getvalue()
+
+
+def _encode_subnet(n, index, randomspace, fmt, indent, engine, seed, timestamp=None, first=0):
+    """Generates subnet number index, whose first host is host number first of the network, with the given engine
+    and returns its hosts encoded in the given format, along with the seconds spent generating and encoding them.
+
+    JSON comes back as array elements (without the brackets), NDJSON and CSV as whole lines."""
+    t = time.perf_counter()
+    if engine == 'numpy':
+        cols = _numpy_subnet(n, randomspace, np.random.default_rng(subnet_seed(seed, index)), timestamp, first,
+                             identity_key(seed))
+        synth = time.perf_counter() - t
+        if fmt == 'csv':
+            chunk = _numpy_csv(n, cols)
+        else:
+            rows = _numpy_encode(n, cols, indent if fmt == 'json' else None)
+    else:
+        hosts = _subnet_hosts(n, index, randomspace, engine, seed, timestamp, first)
+        synth = time.perf_counter() - t
+        if fmt == 'csv':
+            chunk = _encode_csv(hosts)
+        elif fmt == 'json' and indent is not None:
+                            # the elements of the subnet's array, laid out by one call rather than one per host
+            return json.dumps(hosts, indent=indent)[1:-2], synth, time.perf_counter() - t - synth
+        else:
+            rows = _encode_hosts(hosts, None)
+    if fmt == 'ndjson':
+        chunk = '\n'.join(rows) + '\n' if rows else ''
+    elif fmt == 'json':
+        chunk = (', ' if indent is None else ',').join(rows)
+    return chunk, synth, time.perf_counter() - t - synth
+
+
+def _encode_subnet_job(job):
+    """Worker side of write_network()."""
+    return _encode_subnet(*job)
+
+
+def _subnet_hosts(n, index, randomspace, engine, seed, timestamp=None, first=0):
+    """Returns the host descriptions of subnet number index of a network with the given master seed, whose first
+    host is host number first of the network."""
+    if engine == 'numpy':
+        rng = np.random.default_rng(subnet_seed(seed, index))
+        return list(_numpy_rows(n, _numpy_subnet(n, randomspace, rng, timestamp, first, identity_key(seed))))
+    return list(_build_subnet(n, randomspace, subnet_seed(seed, index), timestamp, first, identity_key(seed)))
+
+
+def iter_hosts(subnets, randomspace=False, engine='python', seed=None, timestamp=None):
+    """Yields host descriptions one at a time for the subnet specifications made by build_configs()."""
+    if seed is None:
+        seed = getrandbits(64)
+    offsets = subnet_offsets(subnets)
+    for i, n in enumerate(subnets):
+        yield from _subnet_hosts(n, i, randomspace, engine, seed, timestamp, offsets[i])
+
+
+def _encode_hosts(hosts, indent):
+    """Encodes each host as an element of a JSON array, as json.dumps() would lay it out."""
+    if indent is None:
+        return [json.dumps(h) for h in hosts]
+    pad = '\n' + ' ' * indent
+    return [pad + json.dumps(h, indent=indent).replace('\n', pad) for h in hosts]
+
+
+def open_output(fname, compress=None):
+    """Opens fname for writing text, compressed on the fly with 'gzip' or 'zstd' (which needs zstandard installed)."""
+    if compress is None:
+        return open(fname, 'w')
+    if compress == 'gzip':
+        return gzip.open(fname, 'wt')
+    if compress == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package installed")
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(fname, 'wb')))
+    raise ValueError("Unknown compression '{}'".format(compress))
+
+
+def open_input(fname, compress=None):
+    """Opens fname for reading text, decompressed on the fly; compress ('gzip' or 'zstd') is told from the first
+    bytes of the file when it isn't given."""
+    if compress is None:
+        with open(fname, 'rb') as ifile:
+            magic = ifile.read(4)
+        if magic[:2] == b'\x1f\x8b':
+            compress = 'gzip'
+        elif magic == b'\x28\xb5\x2f\xfd':
+            compress = 'zstd'
+        else:
+            return open(fname)
+    if compress == 'gzip':
+        return gzip.open(fname, 'rt')
+    if compress == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package installed")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(fname, 'rb')))
+    raise ValueError("Unknown compression '{}'".format(compress))
+
+
+class Instrumentation(object):
+    """Collects the timings of a run: wall time per phase, and hosts, bytes (before any compression) and seconds per
+    generated subnet.
+
+    The generation functions take one of these as their instrument argument and call its hooks; subclass it and
+    override the hooks (calling up to these) to watch a run as it goes. summary() returns what was collected."""
+
+    def __init__(self):
+        self.phases = {}
+        self.subnets = []       # (hosts, seconds generating, seconds encoding, bytes) per subnet
+        self.total_subnets = self.total_hosts = 0
+        self.hosts = self.bytes = 0
+        self.started = None     # when the first network started generating
+        self.finished = None    # when the last one was written, unless one is still being generated
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times the enclosed block as (part of) the named phase."""
+        self.phase_start(name)
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_end(name, time.perf_counter() - t)
+
+    def phase_start(self, name):
+        pass
+
+    def phase_end(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def network_start(self, subnets, hosts):
+        """Called before any host is generated, with the number of subnets and hosts to come."""
+        if self.started is None:
+            self.started = time.perf_counter()
+        self.finished = None
+        self.total_subnets += subnets
+        self.total_hosts += hosts
+
+    def network_end(self):
+        """Called once every host of the network has been written."""
+        self.finished = time.perf_counter()
+
+    def subnet_done(self, index, hosts, synth, encode, nbytes):
+        """Called as subnet number index is written out, with its host count, the seconds spent generating and
+        encoding it, and the bytes it takes before any compression."""
+        self.subnets.append((hosts, synth, encode, nbytes))
+        self.hosts += hosts
+        self.bytes += nbytes
+        self.phase_end('host synthesis', synth)
+        self.phase_end('encoding', encode)
+
+    def elapsed(self):
+        """Returns the seconds from when hosts started being generated until the last network was written (or
+        until now, while one is being generated)."""
+        if self.started is None:
+            return 0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def eta(self):
+        """Returns the estimated seconds left until every announced host is written, or None before any is."""
+        if not self.hosts:
+            return None
+        return self.elapsed() * (self.total_hosts - self.hosts) / self.hosts
+
+    def summary(self):
+        """Returns what was collected as a JSON-friendly dictionary."""
+        rates = [hosts / (synth + encode) for hosts, synth, encode, nbytes in self.subnets if synth + encode > 0]
+        elapsed = self.elapsed()
+        return {
+            'elapsed': elapsed,                 # generating networks, so not the phases that come after
+            'phases': dict(self.phases),
+            'subnets': len(self.subnets),
+            'hosts': self.hosts,
+            'bytes': self.bytes,
+            'hosts_per_sec': self.hosts / elapsed if elapsed else None,
+            'subnet_hosts_per_sec': {
+                'min': min(rates, default=None),
+                'mean': sum(rates) / len(rates) if rates else None,
+                'max': max(rates, default=None)
             }
+        }
+
+
+class ProgressReporter(Instrumentation):
+    """Instrumentation that also reports progress on stderr (or ofile) at most every interval seconds."""
+
+    def __init__(self, ofile=None, interval=1.0):
+        Instrumentation.__init__(self)
+        self.ofile = ofile or sys.stderr
+        self.interval = interval
+        self.last = 0
+
+    def phase_start(self, name):
+        if name not in self.phases:
+            print("{}...".format(name), file=self.ofile)
+
+    def subnet_done(self, index, hosts, synth, encode, nbytes):
+        Instrumentation.subnet_done(self, index, hosts, synth, encode, nbytes)
+        now = self.elapsed()
+        if now - self.last >= self.interval or self.hosts == self.total_hosts:
+            self.last = now
+            eta = self.eta()
+            print("  {}/{} subnets, {}/{} hosts, {:.0f} hosts/s, {:.1f} MB before compression, ETA {}".format(
+                    len(self.subnets), self.total_subnets, self.hosts, self.total_hosts,
+                    self.hosts / now if now else 0, self.bytes / 2**20,
+                    '{:.0f}s'.format(eta) if eta is not None else '?'), file=self.ofile)
+
+
+def _ordered_map(pool, func, jobs, window):
+    """Yields func(job) for every job in order, run in pool with no more than window jobs submitted ahead of the one
+    being taken, so results don't pile up when they're consumed slower than they're made."""
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(pool.apply_async(func, (job,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def write_network(subnets, ofile, randomspace=False, prettyprint=True, engine='python', seed=None, workers=1,
+                  timestamp=None, fmt='json', instrument=None):
+    """Streams the hosts of each subnet to the open file ofile, one subnet at a time.
+
+    Every subnet draws from its own random stream derived from seed (a random one if it's None), so the output
+    doesn't depend on how many worker processes share the subnets out. fmt is 'json' (one array), 'ndjson' (one host
+    per line) or 'csv' (a header line, then one host per line). instrument, an Instrumentation, is told about
+    every subnet as it's written."""
+    if fmt not in FORMATS:
+        raise ValueError("Unknown format '{}'".format(fmt))
+    indent = 2 if prettyprint else None
+    sep = ',' if prettyprint else ', '
+    if seed is None:
+        seed = getrandbits(64)
+    offsets = subnet_offsets(subnets)
+    jobs = ((n, i, randomspace, fmt, indent, engine, seed, timestamp, offsets[i]) for i, n in enumerate(subnets))
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        chunks = _ordered_map(pool, _encode_subnet_job, jobs, 2 * workers)
+    else:
+        chunks = map(_encode_subnet_job, jobs)
+
+    instrument = instrument or Instrumentation()
+    instrument.network_start(len(subnets), sum(n['hosts'] for n in subnets))
+    written = 0
+    try:
+        if fmt == 'json':
+            ofile.write('[')
+        elif fmt == 'csv':
+            ofile.write(','.join(CSV_FIELDS) + '\n')
+        for i, (chunk, synth, encode) in enumerate(chunks):
+            if chunk:
+                with instrument.phase('writing'):
+                    if written and fmt == 'json':
+                        ofile.write(sep)
+                    ofile.write(chunk)
+                written += 1
+            instrument.subnet_done(i, subnets[i]['hosts'], synth, encode,
+                                   len(chunk) if chunk.isascii() else len(chunk.encode()))
+        if fmt == 'json':
+            if written and prettyprint:
+                ofile.write('\n')
+            ofile.write(']')
+        instrument.network_end()
+    finally:
+        if pool:
+            pool.terminate()
+
+
+COLUMNAR_MAGIC = b'GSNC\x00\x00\x00\x01'
+
+                            # name, NumPy dtype and bytes per host of each column in a columnar file
+COLUMNAR_FIELDS = [
+    ('subnet', '<u4', 4),
+    ('IP', '<u4', 4),
+    ('mac', 'u1', 6),
+    ('uid', 'u1', 16),
+    ('rDNS_host', 'S8', 8),
+    ('source', 'u1', 1),
+    ('timestamp', '<f8', 8),
+    ('role', 'u1', 1),
+    ('role_confidence', 'u1', 1),
+    ('os', 'u1', 1),
+    ('os_confidence', 'u1', 1)
+]
+
+
+def _columnar_chunk(hosts, s, tables, ipv6):
+    """Packs the hosts of subnet number s into the bytes of each columnar field."""
+    codes = {name: {v: i for i, v in enumerate(tables[name])} for name in ('sources', 'roles', 'oses')}
+    stamps = array('d')
+    for h in hosts:
+        try:
+            stamps.append(dt.fromisoformat(h['record']['timestamp']).timestamp())
+        except ValueError:
+            stamps.append(float('nan'))
+    if ipv6:
+        ips = b''.join(ipaddress.IPv6Address(h['IP']).packed if ':' in h['IP']
+                       else ipaddress.IPv6Address('::ffff:' + h['IP']).packed for h in hosts)
+    else:
+        ips = array('I', (int(ipaddress.IPv4Address(h['IP'])) for h in hosts))
+    cols = {
+        'subnet': array('I', [s] * len(hosts)),
+        'IP': ips,
+        'mac': bytes.fromhex(''.join(h['mac'] for h in hosts).replace(':', '')),
+        'uid': b''.join(uuid.UUID(h['uid']).bytes for h in hosts),
+        'rDNS_host': b''.join(h['rDNS_host'].encode().ljust(8, b'\x00') for h in hosts),
+        'source': bytes(codes['sources'][h['record']['source']] for h in hosts),
+        'timestamp': stamps,
+        'role': bytes(codes['roles'][h['role']['role']] for h in hosts),
+        'role_confidence': bytes(h['role']['confidence'] for h in hosts),
+        'os': bytes(codes['oses'][h['os']['os']] for h in hosts),
+        'os_confidence': bytes(h['os'].get('confidence', 0) for h in hosts)
+    }
+    for name, col in cols.items():
+        if isinstance(col, array):
+            if sys.byteorder == 'big':
+                col.byteswap()
+            cols[name] = col.tobytes()
+    return cols
+
+
+def _columnar_tables(subnets):
+    """Returns the lookup tables of a columnar network of the given subnet specifications."""
+    return {
+        'subnets': [n['subnet'] for n in subnets],
+        'domains': [n.get('domain') for n in subnets],
+        'sources': list(RECORD_SOURCES),
+        'roles': sorted({r for n in subnets for r in n['roles']} | {'Unknown'}),
+        'oses': sorted({o for oses in OS_TYPES.values() for o in oses})
+    }
 
-            while True:
-                a_role = choice(list(role_ct.keys()))
-                if role_ct[a_role] > 0:
-                    role_ct[a_role] -= 1
-                    host['role'] = {
-                        'role': a_role,
-                        'confidence': randrange(55,100)
-                    }
-                    break
-                else:
-                    del(role_ct[a_role])
-
-            host['os'] = { 'os': generate_os_type(host['role']['role']) }
-            if host['os']['os'] != 'Unknown':
-                host['os']['confidence'] = randrange(55,100)
-
-            if (randomspace):
-                while True:
-                    ip = start_ip + randrange(0, 254)
-                    if ip not in ip_taken:
-                        host['IP'] = str(ip)
-                        ip_taken.append(ip)
-                        break
+
+def _columnar_layout(tables, total, ipv6):
+    """Returns the header bytes that follow the magic number of a columnar file of total hosts, the columns as
+    [name, dtype, width, offset] and the size of the file."""
+    columns = []
+    for name, dtype, size in COLUMNAR_FIELDS:
+        if name == 'IP' and ipv6:
+            dtype, size = 'u1', 16
+        columns.append([name, dtype, size, 0])
+    header = dict(tables, hosts=total, columns=columns)
+
+                            # the header holds the column offsets, so size it with placeholders first
+    for col in columns:
+        col[3] = 2**62
+    start = len(COLUMNAR_MAGIC) + 8 + len(json.dumps(header))
+    pos = start + (-start % 8)
+    for col in columns:
+        col[3] = pos
+        pos += col[2] * total
+        pos += -pos % 8
+    meta = json.dumps(header).encode()
+    meta += b' ' * (start - len(COLUMNAR_MAGIC) - 8 - len(meta))
+    return len(meta).to_bytes(8, 'little') + meta, columns, pos
+
+
+def write_columnar(subnets, fname, randomspace=False, engine='python', seed=None, timestamp=None, instrument=None):
+    """Writes the hosts of every subnet to fname as a columnar binary file, to be read back with ColumnarNetwork.
+
+    The file is a magic number, the length of a JSON header, the header (host count, lookup tables for subnets,
+    domains, record sources, roles and OSes, and where each column starts), then one little-endian column per field
+    of COLUMNAR_FIELDS, each 8-byte aligned. IPv4 addresses are uint32s (16 bytes each when there are IPv6 subnets),
+    MACs 6 bytes, UIDs 16 bytes, hostnames 8 NUL-padded bytes, sources/roles/OSes indexes into their table, confidences
+    uint8s (0 for none) and timestamps float64 seconds since the epoch (NaN when they aren't ISO formatted)."""
+    if seed is None:
+        seed = getrandbits(64)
+    instrument = instrument or Instrumentation()
+    total = sum(n['hosts'] for n in subnets)
+    instrument.network_start(len(subnets), total)
+    ipv6 = any(ipaddress.ip_network(n['subnet']).version == 6 for n in subnets)
+    tables = _columnar_tables(subnets)
+    meta, columns, size = _columnar_layout(tables, total, ipv6)
+
+    with open(fname, 'w+b') as ofile:
+        ofile.truncate(size)
+        with mmap.mmap(ofile.fileno(), size) as mm:
+            mm[:len(COLUMNAR_MAGIC) + len(meta)] = COLUMNAR_MAGIC + meta
+            written = 0
+            for s, n in enumerate(subnets):
+                t = time.perf_counter()
+                hosts = _subnet_hosts(n, s, randomspace, engine, seed, timestamp, written)
+                synth = time.perf_counter() - t
+                chunk = _columnar_chunk(hosts, s, tables, ipv6)
+                encode = time.perf_counter() - t - synth
+                with instrument.phase('writing'):
+                    for name, dtype, size, offset in columns:
+                        at = offset + written * size
+                        mm[at:at + len(chunk[name])] = chunk[name]
+                written += len(hosts)
+                instrument.subnet_done(s, len(hosts), synth, encode, sum(len(c) for c in chunk.values()))
+    instrument.network_end()
+
+
+class _HostColumns(object):
+    """What ColumnarNetwork and Network share: hosts held as the columns of COLUMNAR_FIELDS, in the byte layout of a
+    columnar file, with header holding the lookup tables. Subclasses say where each column is with _view()."""
+
+    def __len__(self):
+        return self.header['hosts']
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("host index {} out of range".format(i))
+        return HostView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.host(i)
+
+    def column(self, name):
+        """Returns the named column without copying it: a NumPy array (one row per host) if NumPy is installed,
+        otherwise a flat memoryview of its little-endian bytes."""
+        dtype, width, offset = self.columns[name]
+        buf, start = self._view(name)
+        view = memoryview(buf)[start:start + width * len(self)]
+        if np is None:
+            return view
+        if dtype == 'u1' and width > 1:
+            return np.frombuffer(view, dtype=np.uint8).reshape(len(self), width)
+        return np.frombuffer(view, dtype=dtype)
+
+    def _field(self, name, i):
+        dtype, width, offset = self.columns[name]
+        buf, start = self._view(name)
+        raw = buf[start + i * width:start + (i + 1) * width]
+        if dtype == '<u4':
+            return int.from_bytes(raw, 'little')
+        if dtype == '<f8':
+            return array('d', raw if sys.byteorder == 'little' else raw[::-1])[0]
+        if width == 1:
+            return raw[0]
+        return bytes(raw)
+
+    def get(self, name, i):
+        """Returns field name of host number i, as build_network() describes it; name is a key of the host
+        description, or one of source, timestamp, role, role_confidence, os and os_confidence."""
+        h = self.header
+        if name == 'uid':
+            return str(uuid.UUID(bytes=self._field('uid', i)))
+        if name == 'mac':
+            return self._field('mac', i).hex(':')
+        if name == 'rDNS_host':
+            return self._field('rDNS_host', i).rstrip(b'\x00').decode()
+        if name == 'subnet':
+            return h['subnets'][self._field('subnet', i)]
+        if name == 'rDNS_domain':
+            return h['domains'][self._field('subnet', i)]
+        if name == 'IP':
+            ip = self._field('IP', i)
+            if isinstance(ip, int):
+                return str(ipaddress.IPv4Address(ip))
+            ip = ipaddress.IPv6Address(ip)
+            return str(ip.ipv4_mapped or ip)
+        if name == 'timestamp':
+            stamp = self._field('timestamp', i)
+            return None if math.isnan(stamp) else str(dt.fromtimestamp(stamp))
+        if name in ('source', 'role', 'os'):
+            return h[{'source': 'sources', 'role': 'roles', 'os': 'oses'}[name]][self._field(name, i)]
+        if name == 'os_confidence' and self.get('os', i) == 'Unknown':
+            return None
+        return self._field(name, i)
+
+    def host(self, i):
+        """Returns host number i as the same dictionary build_network() described it with."""
+        if i < 0 or i >= len(self):
+            raise IndexError("host index {} out of range".format(i))
+        host = {
+            'uid': self.get('uid', i),
+            'mac': self.get('mac', i),
+            'rDNS_host': self.get('rDNS_host', i),
+            'subnet': self.get('subnet', i)
+        }
+        domain = self.get('rDNS_domain', i)
+        if domain is not None:
+            host['rDNS_domain'] = domain
+        host['record'] = {
+            'source': self.get('source', i),
+            'timestamp': self.get('timestamp', i)
+        }
+        host['role'] = {
+            'role': self.get('role', i),
+            'confidence': self.get('role_confidence', i)
+        }
+        host['os'] = { 'os': self.get('os', i) }
+        if host['os']['os'] != 'Unknown':
+            host['os']['confidence'] = self.get('os_confidence', i)
+        host['IP'] = self.get('IP', i)
+        return host
+
+
+def _view_property(name, writable=True):
+    def getter(self):
+        return self.network.get(name, self.index)
+
+    def setter(self, value):
+        self.network.set(name, self.index, value)
+    return property(getter, setter if writable else None)
+
+
+class HostView(object):
+    """Host number index of a ColumnarNetwork or Network, read (and for a Network, written) field by field."""
+    __slots__ = ('network', 'index')
+
+    uid = _view_property('uid')
+    mac = _view_property('mac')
+    rDNS_host = _view_property('rDNS_host')
+    subnet = _view_property('subnet')
+    rDNS_domain = _view_property('rDNS_domain', writable=False)
+    IP = _view_property('IP')
+    source = _view_property('source')
+    timestamp = _view_property('timestamp')
+    role = _view_property('role')
+    role_confidence = _view_property('role_confidence')
+    os = _view_property('os')
+    os_confidence = _view_property('os_confidence')
+
+    def __init__(self, network, index):
+        self.network = network
+        self.index = index
+
+    def __repr__(self):
+        return 'HostView({!r})'.format(self.to_dict())
+
+    def to_dict(self):
+        return self.network.host(self.index)
+
+
+class ColumnarNetwork(_HostColumns):
+    """A network written by write_columnar(), with its columns memory-mapped rather than read in."""
+
+    def __init__(self, fname):
+        self._file = open(fname, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+            raise ValueError("{} isn't a columnar network file".format(fname))
+        start = len(COLUMNAR_MAGIC)
+        size = int.from_bytes(self._mm[start:start + 8], 'little')
+        self.header = json.loads(self._mm[start + 8:start + 8 + size])
+        self.columns = {name: (dtype, width, offset) for name, dtype, width, offset in self.header['columns']}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            pass            # columns handed out still point into the map, which goes away along with them
+        self._file.close()
+
+    def _view(self, name):
+        return self._mm, self.columns[name][2]
+
+
+class Network(_HostColumns):
+    """A network held in memory as the columns of a columnar file, a few dozen bytes per host.
+
+    Every field is a growable little-endian column; subnets, domains, record sources, roles and OSes are interned in
+    the lookup tables of header and referenced by index. Hosts can be appended, removed (the last host takes the
+    place of a removed one) and changed field by field, e.g. through the HostView that network[i] returns. Let go of
+    the arrays column() hands out before adding or removing hosts, since they share the columns' memory."""
+
+    def __init__(self, subnets=None, hosts=None):
+        subnets = subnets or []
+        self.header = dict(_columnar_tables(subnets), hosts=0)
+        self.ipv6 = any(ipaddress.ip_network(n['subnet']).version == 6 for n in subnets)
+        self.columns = {}
+        for name, dtype, width in COLUMNAR_FIELDS:
+            if name == 'IP' and self.ipv6:
+                dtype, width = 'u1', 16
+            self.columns[name] = (dtype, width, 0)
+        self._data = {name: bytearray() for name in self.columns}
+        self._codes = {table: {v: i for i, v in enumerate(self.header[table])}
+                       for table in ('subnets', 'sources', 'roles', 'oses')}
+        if hosts is not None:
+            self.extend(hosts)
+
+    def _view(self, name):
+        return self._data[name], 0
+
+    def _intern(self, table, value, domain=None):
+        """Returns the index of value in the lookup table, adding it (and the domain of a new subnet) if need be."""
+        codes = self._codes[table]
+        if value not in codes:
+            if table != 'subnets' and len(codes) == 256:
+                raise ValueError("Too many distinct {} (at most 256)".format(table))
+            codes[value] = len(self.header[table])
+            self.header[table].append(value)
+            if table == 'subnets':
+                self.header['domains'].append(domain)
+                if not self.ipv6 and ':' in value:
+                    self._widen()
+        return codes[value]
+
+    def _widen(self):
+        """Turns the IP column into 16-byte IPv6 addresses, IPv4 ones being mapped."""
+        ips = self._data['IP']
+        self._data['IP'] = bytearray(b''.join(
+            ipaddress.IPv6Address('::ffff:' + str(ipaddress.IPv4Address(int.from_bytes(ips[i:i + 4], 'little'))))
+            .packed for i in range(0, len(ips), 4)))
+        self.columns['IP'] = ('u1', 16, 0)
+        self.ipv6 = True
+
+    def _append(self, chunk, count):
+        for name, col in chunk.items():
+            self._data[name] += col
+        self.header['hosts'] += count
+
+    def extend(self, hosts):
+        """Appends the host descriptions, packing them a subnet's worth at a time."""
+        batch = []
+        for host in hosts:
+            if batch and host['subnet'] != batch[0]['subnet']:
+                self._extend_subnet(batch)
+                batch = []
+            batch.append(host)
+        if batch:
+            self._extend_subnet(batch)
+
+    def _extend_subnet(self, hosts):
+        s = self._intern('subnets', hosts[0]['subnet'], hosts[0].get('rDNS_domain'))
+        for h in hosts:
+            self._intern('sources', h['record']['source'])
+            self._intern('roles', h['role']['role'])
+            self._intern('oses', h['os']['os'])
+        self._append(_columnar_chunk(hosts, s, self.header, self.ipv6), len(hosts))
+
+    def append(self, host):
+        self.extend([host])
+
+    def remove(self, i):
+        """Removes host number i, moving the last host into its place."""
+        if i < 0 or i >= len(self):
+            raise IndexError("host index {} out of range".format(i))
+        last = len(self) - 1
+        for name, (dtype, width, offset) in self.columns.items():
+            col = self._data[name]
+            col[i * width:(i + 1) * width] = col[last * width:]
+            del col[last * width:]
+        self.header['hosts'] -= 1
+
+    def set(self, name, i, value):
+        """Sets field name of host number i, as get() names it."""
+        if i < 0 or i >= len(self):
+            raise IndexError("host index {} out of range".format(i))
+        if name == 'uid':
+            raw = uuid.UUID(value).bytes
+        elif name == 'mac':
+            raw = bytes.fromhex(value.replace(':', ''))
+        elif name == 'rDNS_host':
+            if len(value.encode()) > 8:
+                raise ValueError("Host names are at most 8 bytes long, not {!r}".format(value))
+            raw = value.encode().ljust(8, b'\x00')
+        elif name == 'IP':
+            ip = ipaddress.ip_address(value)
+            if ip.version == 6 and not self.ipv6:
+                self._widen()
+            if self.ipv6:
+                raw = (ip if ip.version == 6 else ipaddress.IPv6Address('::ffff:' + str(ip))).packed
             else:
-                ip = start_ip + hosts_togo
-                host['IP'] = str(ip)
+                raw = int(ip).to_bytes(4, 'little')
+        elif name == 'timestamp':
+            try:
+                stamp = dt.fromisoformat(value).timestamp()
+            except (TypeError, ValueError):
+                stamp = float('nan')
+            raw = array('d', [stamp])
+            if sys.byteorder == 'big':
+                raw.byteswap()
+            raw = raw.tobytes()
+        elif name == 'subnet':
+            raw = self._intern('subnets', value).to_bytes(4, 'little')
+        elif name in ('source', 'role', 'os'):
+            raw = bytes([self._intern({'source': 'sources', 'role': 'roles', 'os': 'oses'}[name], value)])
+        elif name in ('role_confidence', 'os_confidence'):
+            raw = bytes([value or 0])
+        else:
+            raise KeyError(name)
+        width = self.columns[name][1]
+        self._data[name][i * width:(i + 1) * width] = raw
+
+    def save(self, fname):
+        """Writes the network to fname as a columnar file, which ColumnarNetwork and read_network() read back."""
+        tables = {table: self.header[table] for table in ('subnets', 'domains', 'sources', 'roles', 'oses')}
+        meta, columns, size = _columnar_layout(tables, len(self), self.ipv6)
+        with open(fname, 'wb') as ofile:
+            ofile.write(COLUMNAR_MAGIC + meta)
+            for name, dtype, width, offset in columns:
+                ofile.write(b'\x00' * (offset - ofile.tell()))
+                ofile.write(self._data[name])
+            ofile.write(b'\x00' * (size - ofile.tell()))
+
+
+def build_model(subnets, randomspace=False, engine='python', seed=None, timestamp=None):
+    """Returns the network build_network() would write as a Network held in memory."""
+    if seed is None:
+        seed = getrandbits(64)
+    network = Network(subnets)
+    for s, n in enumerate(subnets):
+        hosts = _subnet_hosts(n, s, randomspace, engine, seed, timestamp, len(network))
+        network._append(_columnar_chunk(hosts, s, network.header, network.ipv6), len(hosts))
+    return network
+
+
+def read_network(fname):
+    """Returns the network in the columnar file fname as a Network, read into memory."""
+    network = Network()
+    with ColumnarNetwork(fname) as net:
+        for table in ('subnets', 'domains', 'sources', 'roles', 'oses'):
+            network.header[table] = net.header[table]
+        network._codes = {table: {v: i for i, v in enumerate(network.header[table])}
+                          for table in ('subnets', 'sources', 'roles', 'oses')}
+        network.columns = dict(net.columns)
+        for name, (dtype, width, offset) in net.columns.items():
+            network.columns[name] = (dtype, width, 0)
+            network._data[name] = bytearray(net._mm[offset:offset + width * len(net)])
+        network.ipv6 = net.columns['IP'][1] == 16
+        network.header['hosts'] = len(net)
+    return network
+
+
+def build_network(subnets, fname=None, randomspace=False, prettyprint=True, engine='python', seed=None, workers=1,
+                  timestamp=None, fmt='json', compress=None, instrument=None):
+    """Writes the hosts of every subnet to fname as they are generated, or returns them as a string.
+
+    engine is 'python' (host by host) or 'numpy' (whole subnets at a time as columns; needs NumPy). workers > 1 spreads
+    the subnets over a process pool, with results still written in subnet order. Given the same seed and timestamp,
+    the output is identical whatever the number of workers, and host_at() can regenerate any single host of it.
+    fmt picks 'json', 'ndjson' or 'csv', and compress ('gzip' or 'zstd') compresses fname while it's written.
+    fmt='columnar' hands off to write_columnar() instead, which needs fname and ignores the text-only options.
+    instrument, an Instrumentation, collects the timings of the run."""
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine '{}'".format(engine))
+    if fmt == 'columnar':
+        if not fname or compress:
+            raise ValueError("Columnar output needs an uncompressed file")
+        write_columnar(subnets, fname, randomspace, engine, seed, timestamp, instrument)
+    elif fname:
+        with open_output(fname, compress) as ofile:
+            write_network(subnets, ofile, randomspace, prettyprint, engine, seed, workers, timestamp, fmt, instrument)
+    else:
+        if compress:
+            raise ValueError("Compressed output needs a file name")
+        ofile = io.StringIO()
+        write_network(subnets, ofile, randomspace, prettyprint, engine, seed, workers, timestamp, fmt, instrument)
+        return ofile.getvalue()
 
-            outobj.append(host)
 
-            hosts_togo -= 1
+_SEPARATORS = re.compile(r'[\s,]*')
+_SPACES = re.compile(r'\s*')
 
-    indent = 2 if prettyprint else None
-    if fname:
-        with open(fname, 'w') as ofile:
-            ofile.write("{}".format(json.dumps(outobj, indent=indent)))
+
+def iter_json_array(ifile, size=2**20):
+    """Yields the elements of the JSON array in the open text file ifile one at a time, reading size characters at a
+    time rather than the whole file."""
+    decoder = json.JSONDecoder()
+    buf = ifile.read(size)
+    while buf.isspace():
+        more = ifile.read(size)
+        if not more:
+            break
+        buf += more
+    buf = buf.lstrip()
+    if not buf.startswith('['):
+        raise ValueError("Not a JSON array")
+    pos = 1
+    eof = False
+    while True:
+        pos = _SEPARATORS.match(buf, pos).end()
+        try:
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            element, end = decoder.raw_decode(buf, pos)
+                            # a number (say) may go on past what has been read, unless something follows it
+            after = _SPACES.match(buf, end).end()
+            if after == len(buf) or buf[after] not in ',]':
+                raise ValueError("Incomplete element")
+        except ValueError:
+            if eof:
+                raise ValueError("Truncated or malformed JSON array")
+            more = ifile.read(size)
+            eof = not more
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+        yield element
+        pos = end
+
+
+def _csv_host(row):
+    """Returns the host described by a CSV row with the columns of CSV_FIELDS."""
+    uid, mac, name, domain, subnet, ip, source, stamp, role, role_conf, os, os_conf = row
+    host = {'uid': uid, 'mac': mac, 'rDNS_host': name, 'subnet': subnet}
+    if domain:
+        host['rDNS_domain'] = domain
+    host['record'] = {'source': source, 'timestamp': stamp}
+    host['role'] = {'role': role, 'confidence': int(role_conf)}
+    host['os'] = {'os': os}
+    if os_conf:
+        host['os']['confidence'] = int(os_conf)
+    host['IP'] = ip
+    return host
+
+
+def _is_columnar(fname):
+    with open(fname, 'rb') as ifile:
+        return ifile.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC
+
+
+def read_hosts(fname, compress=None):
+    """Yields the hosts of a network file in any of the formats build_network() writes, compressed or not, one at a
+    time and without reading the whole file into memory."""
+    if _is_columnar(fname):
+        with ColumnarNetwork(fname) as net:
+            for i in range(len(net)):
+                yield net.host(i)
+        return
+
+    with open_input(fname, compress) as ifile:
+        head = ifile.read(256).lstrip()
+    with open_input(fname, compress) as ifile:
+        if head.startswith('['):
+            yield from iter_json_array(ifile)
+        elif head.startswith('{'):
+            for line in ifile:
+                if line.strip():
+                    yield json.loads(line)
+        elif head.startswith(','.join(CSV_FIELDS)):
+            rows = csv.reader(ifile)
+            next(rows)
+            for row in rows:
+                yield _csv_host(row)
+        elif head:
+            raise ValueError("{} isn't a network file".format(fname))
+
+
+def _ip_number(ip):
+    """int(ipaddress.ip_address(ip)), faster for dotted quads."""
+    octets = ip.split('.')
+    if len(octets) == 4:
+        return int.from_bytes(bytes(map(int, octets)), 'big')
+    return int(ipaddress.ip_address(ip))
+
+
+class NetworkValidator(object):
+    """Checks the hosts of a network against the subnet specifications build_configs() planned for it, one host at a
+    time, and gathers statistics about them.
+
+    What's kept grows with the number of subnets, not hosts: a host count, role counts and a bitmap of the addresses
+    taken for each. Without subnets, only what the hosts say about themselves is checked: that every IP is inside
+    its subnet (other than at its network or broadcast address) and nobody else's, and that every OS goes with its
+    role (see OS_TYPES)."""
+
+    def __init__(self, subnets=None, examples=10):
+        self.planned = subnets is not None
+        self.index = {}         # subnet: its number
+        self.specs = []
+        self.bases = []         # first address of each subnet, as a number
+        self.sizes = []
+        self.reserved = []      # offsets of the network and broadcast addresses of each IPv4 subnet
+        self.counts = []
+        self.role_counts = []
+        self.taken = []         # bitmaps of the addresses of each subnet (sets, for huge IPv6 subnets)
+        for n in subnets or []:
+            self._add_subnet(n['subnet'], n)
+        self.hosts = 0
+        self.oses = {}          # role: {os: hosts}
+        self.sources = {}
+        self.violations = {}    # kind: count
+        self.examples = []      # what the first of them were
+        self.max_examples = examples
+        self.started = time.perf_counter()
+
+    def _add_subnet(self, name, n=None):
+        net = ipaddress.ip_network(name)
+        self.index[name] = len(self.specs)
+        self.specs.append(n)
+        self.bases.append(int(net.network_address))
+        self.sizes.append(net.num_addresses)
+        self.reserved.append((0, net.num_addresses - 1) if net.version == 4 and net.num_addresses > 2 else ())
+        self.counts.append(0)
+        self.role_counts.append({})
+        self.taken.append(bytearray((net.num_addresses + 7) // 8) if net.num_addresses <= 2**24 else set())
+        return len(self.specs) - 1
+
+    def violation(self, kind, message):
+        """Records a violation of the given kind."""
+        self.violations[kind] = self.violations.get(kind, 0) + 1
+        if len(self.examples) < self.max_examples:
+            self.examples.append(message)
+
+    def add(self, host):
+        """Checks one host."""
+        self.hosts += 1
+        try:
+            name, ip, role, os = host['subnet'], host['IP'], host['role']['role'], host['os']['os']
+            source = host['record']['source']
+        except (KeyError, TypeError):
+            self.violation('malformed host', "Host #{} is missing fields".format(self.hosts - 1))
+            return
+        uid = host.get('uid')
+
+        s = self.index.get(name)
+        if s is None:
+            try:
+                s = self._add_subnet(name)
+            except ValueError:
+                self.violation('bad subnet', "{} is in subnet {}, which isn't one".format(uid, name))
+                return
+            if self.planned:
+                self.violation('unknown subnet', "{} is in subnet {}, which isn't in the plan".format(uid, name))
+        self.counts[s] += 1
+        roles = self.role_counts[s]
+        roles[role] = roles.get(role, 0) + 1
+        oses = self.oses.setdefault(role, {})
+        oses[os] = oses.get(os, 0) + 1
+        self.sources[source] = self.sources.get(source, 0) + 1
+        if os not in OS_TYPES.get(role, ['Unknown']):
+            self.violation('OS for role', "{} is a {} running {}".format(uid, role, os))
+
+        try:
+            offset = _ip_number(ip) - self.bases[s]
+        except ValueError:
+            self.violation('bad IP', "{} has IP {}, which isn't one".format(uid, ip))
+            return
+        if not 0 <= offset < self.sizes[s]:
+            self.violation('IP outside subnet', "{} has IP {}, outside subnet {}".format(uid, ip, name))
+            return
+        if offset in self.reserved[s]:
+            self.violation('reserved IP', "{} has IP {}, the {} address of subnet {}".format(
+                uid, ip, 'network' if offset == 0 else 'broadcast', name))
+        taken = self.taken[s]
+        if isinstance(taken, set):
+            seen = offset in taken
+            taken.add(offset)
+        else:
+            seen = taken[offset >> 3] & (1 << (offset & 7))
+            taken[offset >> 3] |= 1 << (offset & 7)
+        if seen:
+            self.violation('duplicate IP', "{} has IP {}, which another host has too".format(uid, ip))
+
+    def report(self):
+        """Returns the statistics gathered so far, and every violation found, counting the subnets whose host or
+        role counts are off the plan."""
+        violations, examples = dict(self.violations), list(self.examples)
+
+        def note(kind, message):
+            violations[kind] = violations.get(kind, 0) + 1
+            if len(examples) < self.max_examples:
+                examples.append(message)
+
+        planned_roles = {}
+        for s, n in enumerate(self.specs):
+            if n is None:
+                continue
+            if self.counts[s] != n['hosts']:
+                note('host count', "Subnet {} has {} hosts, not {}".format(n['subnet'], self.counts[s], n['hosts']))
+            roles = self.role_counts[s]
+            for role in sorted(set(n['roles']) | set(roles)):
+                planned_roles[role] = planned_roles.get(role, 0) + n['roles'].get(role, 0)
+                if roles.get(role, 0) != n['roles'].get(role, 0):
+                    note('role count', "Subnet {} has {} {} hosts, not {}".format(
+                        n['subnet'], roles.get(role, 0), role, n['roles'].get(role, 0)))
+
+        elapsed = time.perf_counter() - self.started
+        report = {
+            'hosts': self.hosts,
+            'subnets': len(self.specs),
+            'hosts_per_subnet': {
+                'min': min(self.counts, default=0),
+                'mean': self.hosts / len(self.counts) if self.counts else 0,
+                'max': max(self.counts, default=0)
+            },
+            'roles': {role: sum(oses.values()) for role, oses in sorted(self.oses.items())},
+            'oses': {role: dict(sorted(oses.items())) for role, oses in sorted(self.oses.items())},
+            'sources': dict(sorted(self.sources.items())),
+            'valid': not violations,
+            'violations': violations,
+            'examples': examples,
+            'seconds': elapsed,
+            'hosts_per_sec': self.hosts / elapsed if elapsed else None
+        }
+        if self.planned:
+            report['planned_roles'] = {role: ct for role, ct in sorted(planned_roles.items()) if ct}
+        return report
+
+
+def _checked_fields(net):
+    """Yields the hosts of a ColumnarNetwork or Network with only the fields NetworkValidator checks."""
+    for i in range(len(net)):
+        yield {
+            'uid': net.get('uid', i),
+            'subnet': net.get('subnet', i),
+            'IP': net.get('IP', i),
+            'record': {'source': net.get('source', i)},
+            'role': {'role': net.get('role', i)},
+            'os': {'os': net.get('os', i)}
+        }
+
+
+def validate_network(network, subnets=None, compress=None, examples=10):
+    """Checks a network file (see read_hosts()), or a Network or ColumnarNetwork, host by host against the subnet
+    specifications it was built from, if given, and returns the NetworkValidator report: statistics, violation
+    counts by kind, and the first few violations spelled out."""
+    validator = NetworkValidator(subnets, examples)
+    with contextlib.ExitStack() as stack:
+        if isinstance(network, _HostColumns):
+            hosts = _checked_fields(network)
+        elif _is_columnar(network):
+            hosts = _checked_fields(stack.enter_context(ColumnarNetwork(network)))
+        else:
+            hosts = read_hosts(network, compress)
+        for host in hosts:
+            validator.add(host)
+    return validator.report()
+
+
+                            # client role, server role, protocol, server port, flows per client (relative), median bytes
+FLOW_TYPES = [
+    ('Business workstation', 'DNS server', 'udp', 53, 20, 120),
+    ('Business workstation', 'DHCP server', 'udp', 67, 1, 600),
+    ('Business workstation', 'Active Directory controller', 'tcp', 389, 4, 3000),
+    ('Business workstation', 'Active Directory controller', 'udp', 88, 4, 1500),
+    ('Business workstation', 'Internal web server', 'tcp', 443, 15, 40000),
+    ('Business workstation', 'Mail server', 'tcp', 993, 6, 20000),
+    ('Business workstation', 'File server', 'tcp', 445, 8, 250000),
+    ('Business workstation', 'Printer', 'tcp', 9100, 1, 400000),
+    ('Developer workstation', 'DNS server', 'udp', 53, 20, 120),
+    ('Developer workstation', 'DHCP server', 'udp', 67, 1, 600),
+    ('Developer workstation', 'Active Directory controller', 'tcp', 389, 4, 3000),
+    ('Developer workstation', 'Internal web server', 'tcp', 443, 12, 40000),
+    ('Developer workstation', 'Mail server', 'tcp', 993, 4, 20000),
+    ('Developer workstation', 'Code repository', 'tcp', 22, 8, 500000),
+    ('Developer workstation', 'Code repository', 'tcp', 443, 4, 200000),
+    ('Developer workstation', 'SSH server', 'tcp', 22, 6, 20000),
+    ('Developer workstation', 'Database server', 'tcp', 5432, 4, 50000),
+    ('Developer workstation', 'Printer', 'tcp', 9100, 1, 400000),
+    ('Smartphone', 'DNS server', 'udp', 53, 10, 120),
+    ('Smartphone', 'DHCP server', 'udp', 67, 1, 600),
+    ('Smartphone', 'Internal web server', 'tcp', 443, 6, 30000),
+    ('Smartphone', 'Mail server', 'tcp', 993, 6, 15000),
+    ('VOIP phone', 'DHCP server', 'udp', 67, 1, 600),
+    ('VOIP phone', 'PBX', 'udp', 5060, 4, 2000),
+    ('VOIP phone', 'PBX', 'udp', 5004, 2, 1500000),
+    ('Printer', 'DHCP server', 'udp', 67, 1, 600),
+    ('Internal web server', 'DNS server', 'udp', 53, 4, 120),
+    ('Internal web server', 'Database server', 'tcp', 5432, 20, 15000),
+    ('Mail server', 'DNS server', 'udp', 53, 10, 120),
+    ('Mail server', 'Active Directory controller', 'tcp', 389, 4, 3000),
+    ('File server', 'Active Directory controller', 'udp', 88, 4, 1500),
+    ('Code repository', 'Active Directory controller', 'tcp', 389, 2, 3000),
+    ('DNS server', 'DNS server', 'tcp', 53, 1, 50000),
+    ('Active Directory controller', 'Active Directory controller', 'tcp', 135, 1, 80000),
+    ('Unknown', 'DNS server', 'udp', 53, 5, 120),
+    ('Unknown', 'DHCP server', 'udp', 67, 1, 600),
+    ('Unknown', 'Internal web server', 'tcp', 443, 3, 30000)
+]
+
+FLOW_FORMATS = ['csv', 'ndjson']
+FLOW_FIELDS = ['timestamp', 'src', 'sport', 'dst', 'dport', 'proto', 'bytes', 'packets']
+
+                            # one record, filled in with the fields in FLOW_FIELDS order; timestamps are epoch seconds
+_FLOW_TEMPLATES = {
+    'csv': '%d.%06d,%s,%d,%s,%d,%s,%d,%d\n',
+    'ndjson': '{"timestamp": %d.%06d, "src": "%s", "sport": %d, "dst": "%s", "dport": %d, "proto": "%s", '
+              '"bytes": %d, "packets": %d}\n'
+}
+
+
+_DIGIT_TABLES = {}
+FLOW_BLOCK = 2048           # rows of flow text _flow_text() fills in at a time
+
+
+def _digit_table(count, prefix=b'\x00', blank=False):
+    """Returns every number below count as 4 bytes packed in a uint32: prefix, then its 3 decimal digits, with
+    leading zeros turned into NUL bytes if blank (NUL bytes are dropped from formatted text)."""
+    key = (count, prefix, blank)
+    if key not in _DIGIT_TABLES:
+        digits = [str(i).rjust(3, '\x00') if blank else str(i).zfill(3) for i in range(count)]
+        text = b''.join(prefix + d.encode() for d in digits)
+        _DIGIT_TABLES[key] = np.frombuffer(text, dtype=np.uint32)
+    return _DIGIT_TABLES[key]
+
+
+def _digit_columns(values, groups, zeros=False):
+    """Returns the decimal digits of each value as groups columns of NUL-led 3-digit groups packed in uint32s, most
+    significant first, with its leading zeros turned into NUL bytes unless zeros is set."""
+    if 'groups' not in _DIGIT_TABLES:
+                            # zero-padded groups, then leading groups (blanked zeros), then an all-NUL group
+        _DIGIT_TABLES['groups'] = np.concatenate([_digit_table(1000), _digit_table(1000, blank=True),
+                                                  np.zeros(1, dtype=np.uint32)])
+    table = _DIGIT_TABLES['groups']
+    v = values.astype(np.int64)
+    columns = []
+    for k in range(groups - 1, -1, -1):
+        high = v // 1000**k if k else v
+        group = high % 1000
+        if not zeros:
+            group += 1000 * (high < 1000)
+            if k:
+                group[high == 0] = 2000
+        columns.append(table[group])
+    return columns
+
+
+def _flow_text(template, cols, protos):
+    """Formats a batch of flow records held as NumPy columns, all at once, the way template % record would.
+
+    Every field and every constant of template (padded out with NUL bytes, which are dropped from the text) is a
+    whole number of 4-byte columns, so the rows are laid out as a uint32 matrix and filled in a column at a time;
+    protos holds the NUL-padded name of each proto as such columns."""
+    first, rest = _digit_table(256, blank=True), _digit_table(256, b'.', blank=True)
+
+    def address(ips):
+        return [first[ips >> 24]] + [rest[(ips >> shift) & 255] for shift in (16, 8, 0)]
+
+    fields = [
+        _digit_columns(cols['timestamp'] // 10**6, 4),
+        _digit_columns(cols['timestamp'] % 10**6, 2, zeros=True),
+        address(cols['src']),
+        _digit_columns(cols['sport'], 2),
+        address(cols['dst']),
+        _digit_columns(cols['dport'], 2),
+        [protos[cols['proto'], c] for c in range(protos.shape[1])],
+        _digit_columns(cols['bytes'], 4),
+        _digit_columns(cols['packets'], 3)
+    ]
+    consts = re.split('%0?[0-9]*[ds]', template.replace('%%', '\x00'))
+    row = []                # the constants of a row, with a 0 for every field column
+    columns = []            # (position in the row, values) of every field column
+    for const, field in zip(consts, fields + [[]]):
+        const = const.replace('\x00', '%').encode()
+        row.extend(np.frombuffer(const.rjust(-(-len(const) // 4) * 4, b'\x00'), dtype=np.uint32).tolist())
+        for values in field:
+            columns.append((len(row), values))
+            row.append(0)
+    rows = len(cols['src'])
+    text = np.empty((rows, len(row)), dtype=np.uint32)
+    for top in range(0, rows, FLOW_BLOCK):      # a block at a time, so its rows stay in cache while it's filled in
+        block = text[top:top + FLOW_BLOCK]
+        block[:] = np.array(row, dtype=np.uint32)
+        for c, values in columns:
+            block[:, c] = values[top:top + FLOW_BLOCK]
+    return text.tobytes().translate(None, b'\x00').decode('ascii')
+
+
+class FlowGenerator(object):
+    """Generates flow records between the hosts of a network, following the client/server role pairs of FLOW_TYPES.
+
+    The hosts are read once, in a single streaming pass, into a compact array of IPv4 addresses per role: from the
+    role and IP columns of a ColumnarNetwork or Network as they are, or from any iterable of host descriptions (such
+    as iter_hosts()). Records are then drawn in batches, as NumPy columns if NumPy is installed."""
+
+    def __init__(self, hosts, flow_types=None, seed=None):
+        self.rng = seeded_rng(seed)
+        roles = {}
+        if isinstance(hosts, _HostColumns) and np is not None:
+            if hosts.columns['IP'][0] != '<u4':
+                raise ValueError("Flow records need an IPv4 network")
+            role, ip = hosts.column('role'), hosts.column('IP')
+            for code, name in enumerate(hosts.header['roles']):
+                roles[name] = array('I', ip[role == code].astype(np.uint32).tobytes())
+        else:
+            for host in hosts:
+                ip = ipaddress.ip_address(host['IP'])
+                if ip.version != 4:
+                    raise ValueError("Flow records need an IPv4 network, not {}".format(ip))
+                roles.setdefault(host['role']['role'], array('I')).append(int(ip))
+
+                            # a flow type happens in proportion to its weight and to how many clients it has
+        self.flow_types = [t for t in (flow_types or FLOW_TYPES) if roles.get(t[0]) and roles.get(t[1])]
+        if not self.flow_types:
+            raise ValueError("None of the flow types have both client and server hosts")
+        self.protos = sorted(set(t[2] for t in self.flow_types))
+        names = sorted(set(t[0] for t in self.flow_types) | set(t[1] for t in self.flow_types))
+        self.addresses = array('I')
+        self.ranges = {}
+        for name in names:
+            self.ranges[name] = (len(self.addresses), len(roles[name]))
+            self.addresses.extend(roles[name])
+        self.cum_weights = []
+        total = 0
+        for client, server, proto, port, weight, size in self.flow_types:
+            total += weight * len(roles[client])
+            self.cum_weights.append(total)
+
+    def _python_batch(self, count, start, rate):
+        """Returns count records as a list of tuples, generated with the random module."""
+        rng = self.rng
+        total = self.cum_weights[-1]
+        records = []
+        t = start
+        for _ in range(count):
+            t += rng.expovariate(rate)
+            client, server, proto, port, weight, size = self.flow_types[
+                bisect.bisect_right(self.cum_weights, rng.random() * total)]
+            first, hosts = self.ranges[client]
+            src = self.addresses[first + int(rng.random() * hosts)]
+            first, hosts = self.ranges[server]
+            dst = self.addresses[first + int(rng.random() * hosts)]
+            nbytes = max(40, int(size * rng.lognormvariate(0, 1)))
+            records.append((int(t * 10**6), src, rng.randrange(49152, 65536), dst, port, self.protos.index(proto),
+                            nbytes, 1 + nbytes // 1000))
+        return records
+
+    def _numpy_batch(self, count, start, rate):
+        """Returns count records as a dict of NumPy columns, with timestamps in microseconds."""
+        rng = self._nprng
+        kinds = np.searchsorted(self._np_cum, rng.random(count) * self._np_cum[-1], side='right')
+        stamps = start * 10**6 + np.cumsum(rng.exponential(10**6 / rate, count))
+        cols = {'timestamp': stamps.astype(np.int64)}
+        for end, roles in (('src', self._np_clients), ('dst', self._np_servers)):
+            first, hosts = self._np_ranges[0][roles[kinds]], self._np_ranges[1][roles[kinds]]
+            cols[end] = self._np_addresses[first + (rng.random(count) * hosts).astype(np.int64)]
+        cols['sport'] = rng.integers(49152, 65536, count)
+        cols['dport'] = self._np_ports[kinds]
+        cols['proto'] = self._np_protos[kinds]
+        cols['bytes'] = np.maximum(40, self._np_sizes[kinds] * rng.lognormal(0, 1, count)).astype(np.int64)
+        cols['packets'] = 1 + cols['bytes'] // 1000
+        return cols
+
+    def _numpy_setup(self):
+        self._nprng = np.random.default_rng(self.rng.getrandbits(64))
+        names = sorted(self.ranges)
+        self._np_ranges = np.array([self.ranges[name] for name in names], dtype=np.int64).T
+        self._np_clients = np.array([names.index(t[0]) for t in self.flow_types])
+        self._np_servers = np.array([names.index(t[1]) for t in self.flow_types])
+        self._np_protos = np.array([self.protos.index(t[2]) for t in self.flow_types])
+        self._np_ports = np.array([t[3] for t in self.flow_types])
+        self._np_sizes = np.array([t[5] for t in self.flow_types], dtype=np.float64)
+        self._np_cum = np.array(self.cum_weights, dtype=np.float64)
+        self._np_addresses = np.frombuffer(self.addresses, dtype=np.uint32)
+
+    def batches(self, count, rate=1000.0, start=None, batch=65536):
+        """Yields count records in batches of up to batch records, spaced as if rate flows happened per second from
+        the epoch time start (now by default). Each batch is a dict of NumPy columns named as in FLOW_FIELDS if NumPy
+        is installed (with timestamps in microseconds, IPs as integers and protos as indexes into self.protos),
+        otherwise a list of tuples of the same."""
+        t = time.time() if start is None else start
+        if np is not None:
+            self._numpy_setup()
+        while count > 0:
+            size = min(batch, count)
+            if np is not None:
+                cols = self._numpy_batch(size, t, rate)
+                t = cols['timestamp'][-1] / 10**6
+            else:
+                cols = self._python_batch(size, t, rate)
+                t = cols[-1][0] / 10**6
+            count -= size
+            yield cols
+
+    def records(self, count, rate=1000.0, start=None):
+        """Yields count flow records as dictionaries, one at a time."""
+        for records in self.batches(count, rate, start):
+            if np is not None:
+                records = zip(*(records[f].tolist() for f in FLOW_FIELDS))
+            for stamp, src, sport, dst, dport, proto, nbytes, packets in records:
+                yield {
+                    'timestamp': stamp / 10**6,
+                    'src': str(ipaddress.IPv4Address(src)),
+                    'sport': sport,
+                    'dst': str(ipaddress.IPv4Address(dst)),
+                    'dport': dport,
+                    'proto': self.protos[proto],
+                    'bytes': nbytes,
+                    'packets': packets
+                }
+
+    def write(self, ofile, count, fmt='csv', rate=1000.0, start=None, batch=65536):
+        """Streams count records to the open file ofile as 'csv' (after a header line) or 'ndjson'."""
+        if fmt not in FLOW_FORMATS:
+            raise ValueError("Unknown flow format '{}'".format(fmt))
+        template = _FLOW_TEMPLATES[fmt]
+        if fmt == 'csv':
+            ofile.write(','.join(FLOW_FIELDS) + '\n')
+        if np is not None:
+            width = -(-max(len(p) for p in self.protos) // 4) * 4
+            protos = np.array([list(p.encode().ljust(width, b'\x00')) for p in self.protos], dtype=np.uint8)
+            protos = protos.view(np.uint32)
+        for records in self.batches(count, rate, start, batch):
+            if np is not None:
+                ofile.write(_flow_text(template, records, protos))
+                continue
+            for stamp, src, sport, dst, dport, proto, nbytes, packets in records:
+                ofile.write(template % (stamp // 10**6, stamp % 10**6, ipaddress.IPv4Address(src), sport,
+                                        ipaddress.IPv4Address(dst), dport, self.protos[proto], nbytes, packets))
+
+
+def write_flows(hosts, fname, count, fmt='csv', compress=None, rate=1000.0, start=None, seed=None):
+    """Writes count flow records between the given hosts (host descriptions or a ColumnarNetwork) to fname."""
+    flows = FlowGenerator(hosts, seed=seed)
+    with open_output(fname, compress) as ofile:
+        flows.write(ofile, count, fmt, rate, start)
+
+
+ZONE_BUFFER = 65536         # PTR records write_zones() holds before appending them to their reverse zones
+
+
+def _zone_header(ofile, origin, nameserver, ttl, serial):
+    ofile.write('$TTL {ttl}\n$ORIGIN {origin}.\n@\tIN\tSOA\t{ns} hostmaster.{origin}. ({serial} {refresh} {retry} '
+                '604800 {ttl})\n\tIN\tNS\t{ns}\n'.format(origin=origin, ns=nameserver, ttl=ttl, serial=serial,
+                                                           refresh=ttl, retry=ttl // 4))
+
+
+def write_zones(hosts, directory, domain=None, nameserver='localhost.', ttl=3600, serial=None):
+    """Writes DNS zone files for hosts to directory, in one pass: a forward zone for domain (<domain>.zone) with the
+    A (or AAAA) record of every host under its rDNS_domain, and a reverse zone (<c.b.a>.in-addr.arpa.zone) with the
+    PTR records of every /24 the hosts' IPv4 addresses are in. Returns the number of records, of reverse zones, and
+    of hosts left out for being outside domain.
+
+    domain defaults to the one build_configs() was given, the parent of the first host's rDNS_domain; hosts without
+    one go at the top of the zone. Hosts come grouped by subnet, so the forward zone only changes $ORIGIN when the
+    subnet does, and the PTR records are held per reverse zone and appended to the zone files ZONE_BUFFER at a
+    time, rather than sorting the inventory; each zone file is opened once per batch however the /24s are spread
+    across the hosts."""
+    hosts = iter(hosts)
+    first = next(hosts, None)
+    if first is None:
+        return {'records': 0, 'reverse_zones': 0, 'out_of_zone': 0}
+    if domain is None:
+        if 'rDNS_domain' not in first:
+            raise ValueError("The hosts have no domain, so write_zones() needs one")
+        domain = first['rDNS_domain'].partition('.')[2] or first['rDNS_domain']
+    domain = domain.rstrip('.')
+    serial = serial or int(time.strftime('%Y%m%d01'))
+    os.makedirs(directory, exist_ok=True)
+
+    records = out_of_zone = buffered = 0
+    pending = collections.defaultdict(list)     # zone: PTR records not written yet
+    started = set()
+    current = None
+
+    def flush():
+        for zone, lines in pending.items():
+            if zone in started:
+                ofile = open(os.path.join(directory, zone + '.zone'), 'a')
+            else:
+                ofile = open(os.path.join(directory, zone + '.zone'), 'w')
+                _zone_header(ofile, zone, nameserver, ttl, serial)
+                started.add(zone)
+            with ofile:
+                ofile.writelines(lines)
+        pending.clear()
+
+    with open(os.path.join(directory, domain + '.zone'), 'w') as forward:
+        _zone_header(forward, domain, nameserver, ttl, serial)
+        for host in itertools.chain([first], hosts):
+            origin = host.get('rDNS_domain', domain)
+            if origin != current:
+                if origin != domain and not origin.endswith('.' + domain):
+                    out_of_zone += 1
+                    continue
+                forward.write('$ORIGIN {}.\n'.format(origin))
+                current = origin
+            ip = host['IP']
+            forward.write('{}\tIN\t{}\t{}\n'.format(host['rDNS_host'], 'AAAA' if ':' in ip else 'A', ip))
+            records += 1
+            if ':' in ip:
+                continue
+
+            a, b, c, d = ip.split('.')
+            pending['{}.{}.{}.in-addr.arpa'.format(c, b, a)].append('{}\tIN\tPTR\t{}.{}.\n'.format(
+                d, host['rDNS_host'], origin))
+            records += 1
+            buffered += 1
+            if buffered == ZONE_BUFFER:
+                flush()
+                buffered = 0
+    flush()
+    return {'records': records, 'reverse_zones': len(started), 'out_of_zone': out_of_zone}
+
+
+MAX_NODES = 4000000
+
+                            # what a network spec in a batch file may hold, and the defaults for what it leaves out
+SPEC_DEFAULTS = {
+    'nodes': 500,
+    'max': None,            # default_maximum(subnet_capacity(supernet, prefixlen)), 150 for a /24
+    'min': None,            # default_minimum(max, subnet_capacity(supernet, prefixlen))
+    'devices': {},          # overrides of get_default_dev_distro(); what's left over goes to 'Unknown'
+    'domain': None,         # generated
+    'randomspace': True,
+    'seed': None,
+    'supernet': '10.0.0.0/8',
+    'prefixlen': 24,
+    'oui': None,            # locally administered MACs
+    'engine': 'python',
+    'format': 'json',
+    'compress': None,
+    'prettyprint': True,
+    'workers': 1,
+    'output': None,         # <timestamp>-<number in the batch>.<format>
+    'plan': None,           # file to save the subnet specifications in, for validate_network()
+    'zones': None           # directory to write DNS zone files for the hosts to
+}
+
+
+def load_specs(fname):
+    """Returns the network specs in the JSON file fname ('-' for stdin): a list of specs, or an object whose
+    'networks' list holds them and whose 'defaults' apply to all of them."""
+    if fname == '-':
+        doc = json.load(sys.stdin)
     else:
-        return json.dumps(outobj, indent=indent)
+        with open(fname) as ifile:
+            doc = json.load(ifile)
+    if isinstance(doc, list):
+        return doc
+    return [dict(doc.get('defaults', {}), **spec) for spec in doc['networks']]
+
+
+def plan_network(spec, rng=None):
+    """Returns the subnet specifications for a network spec, or None if it can't be honored."""
+    nodect = spec['nodes']
+    if nodect > MAX_NODES or nodect < 1:
+        print("ERROR: Can't build a network of {} nodes (1 to {})".format(nodect, MAX_NODES))
+        return None
+    try:
+        capacity = subnet_capacity(spec['supernet'], spec['prefixlen'])
+    except ValueError as e:
+        print("ERROR: {}".format(e))
+        return None
+    maximum = spec['max'] if spec['max'] is not None else default_maximum(capacity)
+    if nodect <= capacity:
+        subnets = [nodect]
+    elif maximum > capacity:
+        print("ERROR: A /{} subnet only holds {} hosts, not {}".format(spec['prefixlen'], capacity, maximum))
+        return None
+    else:
+        minimum = spec['min'] if spec['min'] is not None else default_minimum(maximum, capacity)
+        subnets = randomize_subnet_breakdown(nodect, minimum, maximum, rng)
+        if subnets is None:
+            print("ERROR: Can't break {} nodes into subnets of {} to {} hosts".format(nodect, minimum, maximum))
+            return None
+
+    dev_breakdown = get_default_dev_distro(nodect, printout=False)
+    if spec['devices']:
+        room = nodect - sum(spec['devices'].values())
+        if room < 0:
+            print("ERROR: Device roles add up to more than {} nodes".format(nodect))
+            return None
+        others = {r: ct for r, ct in dev_breakdown.items() if r not in spec['devices']}
+        total = sum(others.values())
+        if total > room:            # the roles left out share what the listed ones leave, in their default ratios
+            others = {r: ct * room // total for r, ct in others.items()}
+        dev_breakdown = dict(others, **spec['devices'])
+        dev_breakdown['Unknown'] = dev_breakdown.get('Unknown', 0) + nodect - sum(dev_breakdown.values())
+    domain = spec['domain'] or generate_fqdn(seed=rng)
+    return build_configs(subnets, nodect, dev_breakdown, domain, spec['supernet'], spec['prefixlen'], rng,
+                         oui=spec['oui'])
+
+
+def run_spec(spec, plans=None):
+    """Plans and builds the network of one spec (filled in with SPEC_DEFAULTS, whose keys are all it may hold
+    besides the 'index' run_batch() gives it); returns its file name, or None.
+
+    Specs with a seed have their plan kept in the plans dict, if given, so a later spec with the same seed and
+    planning parameters skips straight to building hosts."""
+    unknown = set(spec) - set(SPEC_DEFAULTS) - {'index'}
+    if unknown:
+        print("ERROR: Unknown spec keys: {}".format(', '.join(sorted(unknown))))
+        return None
+    spec = dict(SPEC_DEFAULTS, **spec)
+    key = None
+    if spec['seed'] is not None:
+        key = json.dumps([spec[k] for k in ('nodes', 'max', 'min', 'devices', 'domain', 'seed', 'supernet',
+                                            'prefixlen', 'oui')], sort_keys=True)
+    if plans is not None and key in plans:
+        net_configs = plans[key]
+    else:
+        net_configs = plan_network(spec, seeded_rng(spec['seed']))
+        if net_configs is None:
+            return None
+        if plans is not None and key is not None:
+            plans[key] = net_configs
+    if spec['plan']:
+        with open(spec['plan'], 'w') as ofile:
+            json.dump(net_configs, ofile, indent=4)
+
+    outname = spec['output']
+    if outname is None:
+        outname = '{}-{}{}'.format(time.strftime("%Y%m%d-%H%M%S"), spec.get('index', 0), EXTENSIONS[spec['format']])
+        if spec['compress']:
+            outname += EXTENSIONS[spec['compress']]
+    try:
+        build_network(net_configs, outname, spec['randomspace'], spec['prettyprint'], spec['engine'], spec['seed'],
+                      spec['workers'], fmt=spec['format'], compress=spec['compress'])
+    except (ValueError, ImportError) as e:
+        print("ERROR: {}: {}".format(outname, e))
+        return None
+    if spec['zones']:
+        with contextlib.closing(read_hosts(outname)) as hosts:
+            write_zones(hosts, spec['zones'])
+    if VERBOSE:
+        print("Saved network of {} nodes to {}".format(spec['nodes'], outname))
+    return outname
+
+
+def _run_spec_job(spec, plans=None):
+    """Runs one spec of run_batch(), reporting whatever goes wrong with it instead of giving up on the batch."""
+    try:
+        return run_spec(spec, plans)
+    except Exception as e:
+        print("ERROR: Network {}: {}: {}".format(spec['index'], type(e).__name__, e))
+        return None
+
+
+def run_batch(specs, jobs=1):
+    """Builds the network of every spec, jobs of them at a time; returns the file names (None for failed specs).
+
+    Specs built at the same time generate their hosts in one process each, whatever their workers, as pool workers
+    can't start pools of their own."""
+    specs = [dict(spec, index=spec.get('index', i)) for i, spec in enumerate(specs)]
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            return pool.map(_run_spec_job, [dict(spec, workers=1) for spec in specs], chunksize=1)
+    plans = {}
+    return [_run_spec_job(spec, plans) for spec in specs]
+
+
+                            # what a spec sent to NetworkServer may hold; the rest of SPEC_DEFAULTS is about files
+SERVE_KEYS = ['nodes', 'max', 'min', 'devices', 'domain', 'randomspace', 'seed', 'supernet', 'prefixlen', 'oui',
+              'engine', 'format', 'prettyprint']
+CONTENT_TYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+class NetworkServer(object):
+    """Serves generated networks over HTTP on a local TCP port or Unix socket, streaming the hosts of each request as
+    they're generated.
+
+    POST a network spec (a JSON object with any of SERVE_KEYS, which mean what they do in SPEC_DEFAULTS) to /network,
+    or GET /network?nodes=1000&seed=1&format=ndjson, and the hosts come back with chunked transfer encoding, exactly
+    as build_network() would write them, with the seed in the X-Gensynet-Seed header (picked at random when the
+    spec has none). /plan answers with the subnet specifications instead.
+
+    Subnets are generated in an executor, two at a time per request, so the event loop keeps serving other clients
+    and no client has more than that waiting to be sent; a slow reader just slows its own generation down. The plans
+    of the last cache seeded specs are kept, so repeating one skips planning."""
+
+    def __init__(self, workers=0, cache=32):
+        self.executor = concurrent.futures.ProcessPoolExecutor(workers) if workers > 0 else None
+        self.cache = cache
+        self.plans = collections.OrderedDict()     # spec key: future of its plan, least recently used first
+
+    def close(self):
+        """Stops the worker processes, if any."""
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def plan(self, spec, cache=True):
+        """Returns the subnet specifications of a spec (filled in with SPEC_DEFAULTS and seeded), or None if it can't
+        be honored. The plan is only kept for later requests if cache is set."""
+        if not cache:
+            return await asyncio.get_running_loop().run_in_executor(None, plan_network, spec, seeded_rng(spec['seed']))
+        key = json.dumps([spec[k] for k in ('nodes', 'max', 'min', 'devices', 'domain', 'seed', 'supernet',
+                                            'prefixlen', 'oui')], sort_keys=True)
+        future = self.plans.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(None, plan_network, spec, seeded_rng(spec['seed']))
+            self.plans[key] = future
+            while len(self.plans) > self.cache:
+                self.plans.popitem(last=False)
+        self.plans.move_to_end(key)
+        net_configs = await future
+        if net_configs is None:
+            self.plans.pop(key, None)
+        return net_configs
+
+    async def stream(self, spec, net_configs, writer):
+        """Writes the hosts of net_configs to writer as the chunks of an HTTP response, waiting for the client to take
+        each one before generating more than the next."""
+        loop = asyncio.get_running_loop()
+        fmt = spec['format']
+        indent = 2 if spec['prettyprint'] else None
+        sep = ',' if spec['prettyprint'] else ', '
+        offsets = subnet_offsets(net_configs)
+        jobs = ((n, i, spec['randomspace'], fmt, indent, spec['engine'], spec['seed'], None, offsets[i])
+                for i, n in enumerate(net_configs))
+        pending = collections.deque()
+
+        def send(text):
+            data = text.encode()
+            writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+        try:
+            for job in jobs:
+                pending.append(loop.run_in_executor(self.executor, _encode_subnet_job, job))
+                if len(pending) == 2:
+                    break
+            if fmt == 'json':
+                send('[')
+            elif fmt == 'csv':
+                send(','.join(CSV_FIELDS) + '\n')
+            written = 0
+            while pending:
+                chunk = (await pending.popleft())[0]
+                job = next(jobs, None)
+                if job:
+                    pending.append(loop.run_in_executor(self.executor, _encode_subnet_job, job))
+                if chunk:
+                    send(sep + chunk if written and fmt == 'json' else chunk)
+                    written += 1
+                    await writer.drain()
+            if fmt == 'json':
+                send('\n]' if written and spec['prettyprint'] else ']')
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def respond(self, writer, status, body, content_type='text/plain', headers=''):
+        """Writes a whole HTTP response, with any extra header lines (each ending in CRLF) in headers."""
+        data = body.encode()
+        writer.write('HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n{}Connection: close\r\n\r\n'.format(
+            status, content_type, len(data), headers).encode() + data)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        """Answers one HTTP request."""
+        streaming = False
+        try:
+            method, target, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            url = urllib.parse.urlsplit(target)
+            if method == 'POST':
+                spec = json.loads(await reader.readexactly(int(headers.get('content-length', 0))) or '{}')
+            elif method == 'GET':
+                spec = {}
+                for k, v in urllib.parse.parse_qsl(url.query):
+                    try:
+                        spec[k] = json.loads(v)
+                    except ValueError:
+                        spec[k] = v
+            else:
+                await self.respond(writer, '405 Method Not Allowed', 'Use GET or POST\n')
+                return
+            if url.path not in ('/network', '/plan'):
+                await self.respond(writer, '404 Not Found', 'Try /network or /plan\n')
+                return
+            if not isinstance(spec, dict) or set(spec) - set(SERVE_KEYS):
+                await self.respond(writer, '400 Bad Request', 'A spec is an object with some of {}\n'.format(
+                    ', '.join(SERVE_KEYS)))
+                return
+            spec = dict(SPEC_DEFAULTS, **spec)
+            if spec['format'] not in FORMATS or spec['engine'] not in ENGINES:
+                await self.respond(writer, '400 Bad Request', 'Formats are {}, engines {}\n'.format(
+                    ', '.join(FORMATS), ', '.join(ENGINES)))
+                return
+
+            seeded = spec['seed'] is not None
+            if not seeded:      # picked before planning, so that the seed sent back reproduces the subnets too
+                spec['seed'] = getrandbits(64)
+            net_configs = await self.plan(spec, cache=seeded)
+            if net_configs is None:
+                await self.respond(writer, '400 Bad Request', "Can't plan that network\n")
+            elif url.path == '/plan':
+                await self.respond(writer, '200 OK', json.dumps(net_configs, indent=4), CONTENT_TYPES['json'],
+                                   'X-Gensynet-Seed: {}\r\n'.format(spec['seed']))
+            else:
+                streaming = True
+                writer.write('HTTP/1.1 200 OK\r\nContent-Type: {}\r\nTransfer-Encoding: chunked\r\n'
+                             'X-Gensynet-Seed: {}\r\nConnection: close\r\n\r\n'.format(
+                                 CONTENT_TYPES[spec['format']], spec['seed']).encode())
+                await self.stream(spec, net_configs, writer)
+        except (ValueError, TypeError, KeyError, asyncio.IncompleteReadError) as e:
+            if streaming:
+                print("ERROR: {}".format(e))     # the response is cut short, without its last chunk
+            else:
+                await self.respond(writer, '400 Bad Request', 'Malformed request\n')
+        except ConnectionError:
+            pass            # the client went away
+        finally:
+            writer.close()
+
+    async def serve(self, address):
+        """Serves until cancelled on address: 'host:port', or the path of a Unix socket."""
+        host, _, port = address.rpartition(':')
+        if port.isdigit():
+            server = await asyncio.start_server(self.handle, host or '127.0.0.1', int(port))
+        else:
+            server = await asyncio.start_unix_server(self.handle, address)
+        async with server:
+            await server.serve_forever()
+
 
 def main():
     global VERBOSE, VERSION, NET_SUMMARY, OLDVERSION
@@ -404,8 +3041,43 @@ def main():
     parser.add_argument('-v', '--verbose', help='Provide program feedback', action="store_true")
     parser.add_argument('-s', '--summarize', help='Prints network configurations to output', action="store_true")
     parser.add_argument('-d', '--deprecate', help='Use the deprecated version for building subnets', action='store_true')
+    parser.add_argument('--supernet', help='Address block to place subnets in [10.0.0.0/8]', default='10.0.0.0/8')
+    parser.add_argument('--prefixlen', help='Prefix length of each subnet [24]', type=int, default=24)
+    parser.add_argument('--oui', help='Vendor prefix (xx:xx:xx) of every MAC [locally administered MACs]')
+    parser.add_argument('--engine', help='Host generation engine [python]', choices=ENGINES, default='python')
+    parser.add_argument('-f', '--format', help='Output file format [json]', choices=FORMATS + ['columnar'],
+                        default='json')
+    parser.add_argument('-z', '--compress', help='Compress the output file', choices=COMPRESSIONS)
+    parser.add_argument('--seed', help='Seed that makes the whole network reproducible', type=int)
+    parser.add_argument('--workers', help='Number of processes generating hosts [1]', type=int, default=1)
+    parser.add_argument('-p', '--progress', help='Reports progress and throughput on stderr', action='store_true')
+    parser.add_argument('--flows', help='Also writes this many flow records between the hosts', type=int, default=0,
+                        metavar='COUNT')
+    parser.add_argument('--zones', help='Also writes forward and reverse DNS zone files for the hosts to DIR',
+                        metavar='DIR')
+    parser.add_argument('--spec', '--batch', help='Build the networks in a JSON spec file (- for stdin) without prompting',
+                        metavar='FILE')
+    parser.add_argument('--plan', help='Saves the subnet plan to FILE, or with --validate checks against the one in it',
+                        metavar='FILE')
+    parser.add_argument('--validate', help='Checks a network file (against --plan) and prints a report instead of '
+                        'building one', metavar='FILE')
+    parser.add_argument('--serve', help='Serves networks over HTTP on [HOST:]PORT or a Unix socket instead of '
+                        'prompting', metavar='ADDRESS')
+    parser.add_argument('--jobs', help='Number of specs to build at once in batch mode [1]', type=int, default=1)
     parser.add_argument('--version', help='Prints version', action="store_true")
     args = parser.parse_args()
+    if args.format == 'columnar' and args.compress:
+        parser.error("-f columnar can't be compressed with -z")
+    if args.compress == 'zstd' and zstandard is None:
+        parser.error("-z zstd needs the zstandard package installed")
+    if args.engine == 'numpy' and np is None:
+        parser.error("--engine numpy needs NumPy installed")
+    try:
+        capacity = subnet_capacity(args.supernet, args.prefixlen)
+    except ValueError as e:
+        parser.error(str(e))
+    if capacity < 3:
+        parser.error("--prefixlen {} leaves room for only {} hosts per subnet".format(args.prefixlen, max(capacity, 0)))
     if args.version:
         print("{} v{}".format(sys.argv[0], VERSION))
         sys.exit()
@@ -416,15 +3088,58 @@ def main():
     if args.deprecate:
         OLDVERSION = True
 
-    outname = '{}.json'.format(time.strftime("%Y%m%d-%H%M%S"))
+    if args.validate:
+        subnets = None
+        if args.plan:
+            with open(args.plan) as ifile:
+                subnets = json.load(ifile)
+        try:
+            report = validate_network(args.validate, subnets, args.compress)
+        except (ValueError, ImportError) as e:
+            print("ERROR: {}: {}".format(args.validate, e))
+            sys.exit(1)
+        print(json.dumps(report, indent=4))
+        sys.exit(0 if report['valid'] else 1)
+
+    if args.serve:
+        server = NetworkServer(args.workers if args.workers > 1 else 0)
+        print("Serving networks on {}".format(args.serve))
+        try:
+            asyncio.run(server.serve(args.serve))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+        sys.exit()
+
+    if args.spec:
+                                # command line options are the defaults for whatever the specs leave out
+        defaults = {'supernet': args.supernet, 'prefixlen': args.prefixlen, 'oui': args.oui, 'engine': args.engine,
+                    'format': args.format, 'compress': args.compress, 'seed': args.seed, 'workers': args.workers}
+        specs = [dict(defaults, **spec) for spec in load_specs(args.spec)]
+        outnames = run_batch(specs, args.jobs)
+        for outname in outnames:
+            if outname:
+                print("Saved network profile to {}".format(outname))
+        sys.exit(0 if all(outnames) else 1)
+
+    stem = time.strftime("%Y%m%d-%H%M%S")
+    outname = stem + EXTENSIONS[args.format]
+    flowfmt = 'ndjson' if args.format == 'ndjson' else 'csv'
+    flowname = stem + '-flows' + EXTENSIONS[flowfmt]
+    if args.compress:
+        outname += EXTENSIONS[args.compress]
+        flowname += EXTENSIONS[args.compress]
+    rng = seeded_rng(args.seed)
+    instrument = ProgressReporter() if args.progress else Instrumentation()
 
     print('\n\n\tSYNTHETIC NETWORK NODE GENERATOR\n')
 
     while True:
         nodect = int(input("How many network nodes? [500]: ") or "500")
 
-        if nodect > 4000000:
-            print("That ({}) is just exorbitant. Next time try less than {}.".format(nodect, 4000000))
+        if nodect > MAX_NODES:
+            print("That ({}) is just exorbitant. Next time try less than {}.".format(nodect, MAX_NODES))
             sys.exit()
 
                                 #  setting subnet breakdown ----------------
@@ -465,20 +3180,20 @@ def main():
             MAX_max = MAX_min = -1
             while True:
                 subnets = []
-                if nodect <= 252:
+                if nodect <= capacity:
                     subnets.append(nodect)
                 else:
                     if MAX_max == -1:
-                        MAX_max = 150
+                        MAX_max = default_maximum(capacity)
                     while True:
-                        maximum = int(input('Max hosts in subnet (UP TO 252) [{}]: '.format(MAX_max)) or MAX_max)
-                        if (maximum < 3 or maximum > 252):
+                        maximum = int(input('Max hosts in subnet (UP TO {}) [{}]: '.format(capacity, MAX_max)) or MAX_max)
+                        if (maximum < 3 or maximum > capacity):
                             print("Illegal 'maximum' value.")
                         else:
                             break
 
                     if MAX_min == -1 or maximum != MAX_max:
-                        MAX_min = 254-maximum
+                        MAX_min = default_minimum(maximum, capacity)
                     while True:
                         minimum = int(input('Min hosts in subnet (UP TO {}) [{}]: '.format(MAX_min, MAX_min)) or MAX_min)
                         if (minimum < 2 or minimum > MAX_min):
@@ -488,12 +3203,17 @@ def main():
                     MAX_min = minimum
                     MAX_max = maximum
 
-                    subnets = randomize_subnet_breakdown(nodect, minimum, maximum)
+                    with instrument.phase('subnet breakdown'):
+                        subnets = randomize_subnet_breakdown(nodect, minimum, maximum, rng)
+                    if subnets is None:
+                        print("Can't break {} nodes into subnets of {} to {} hosts.".format(nodect, minimum, maximum))
+                        MAX_max = MAX_min = -1
+                        continue
 
                 for i,e in enumerate(subnets):
                     print('\tSubnet #{} has {} hosts.'.format(i, subnets[i]))
 
-                if (nodect > 252):
+                if (nodect > capacity):
                     subnets_finished = input("Is this breakout of subnets OK? [Yes]: ") or "Yes"
                     if subnets_finished.lower() == 'yes' or subnets_finished.lower() == 'y':
                         break
@@ -524,26 +3244,49 @@ def main():
             if (remainder > 0):
                 dev_breakdown['Unknown'] += remainder
 
-        domain = input("Domain name to use (press ENTER to auto-generate): ") or generate_fqdn()
+        domain = input("Domain name to use (press ENTER to auto-generate): ") or generate_fqdn(seed=rng)
         randomize = input("Randomize IP addresses in subnet? [Yes]: ") or "Yes"
         cont = input("Ready to generate json (No to start over)? [Yes]: ") or "Yes"
         if cont.lower() == 'yes' or cont.lower() == 'y':
             break
 
     if OLDVERSION:
-        net_configs = build_configs_deprecated(nodect, net_breakdown, dev_breakdown, domain)
+        net_configs = build_configs_deprecated(nodect, net_breakdown, dev_breakdown, domain, rng)
     else:
-        net_configs = build_configs(subnets, nodect, dev_breakdown, domain)
+        net_configs = build_configs(subnets, nodect, dev_breakdown, domain, args.supernet, args.prefixlen, rng,
+                                    instrument, args.oui)
+    if net_configs is None:
+        sys.exit(1)
+    if args.plan:
+        with open(args.plan, 'w') as ofile:
+            json.dump(net_configs, ofile, indent=4)
     if NET_SUMMARY or VERBOSE:
         print("\nBased on the following config:\n")
         print(json.dumps(net_configs, indent=4))
         print("\nSaved network profile to {}".format(outname))
     else:
         print("\n Saved network profile to {}".format(outname))
-    if randomize.lower() == 'yes' or randomize.lower() == 'y':
-        build_network(net_configs, outname, randomspace=True)
-    else:
-        build_network(net_configs, outname)
+    randomspace = randomize.lower() == 'yes' or randomize.lower() == 'y'
+    seed = args.seed if args.seed is not None else getrandbits(64)
+    build_network(net_configs, outname, randomspace, engine=args.engine, seed=seed, workers=args.workers,
+                  fmt=args.format, compress=args.compress, instrument=instrument)
+    if args.flows:
+                            # the flows are between the hosts just written, read back or generated again from the seed
+        if args.format == 'columnar':
+            hosts = ColumnarNetwork(outname)
+        else:
+            hosts = iter_hosts(net_configs, randomspace, args.engine, seed)
+        with contextlib.closing(hosts), instrument.phase('flows'):
+            write_flows(hosts, flowname, args.flows, flowfmt, args.compress, seed=seed)
+        print("Saved {} flow records to {}".format(args.flows, flowname))
+    if args.zones:
+        with contextlib.closing(read_hosts(outname)) as hosts, instrument.phase('zones'):
+            zones = write_zones(hosts, args.zones, domain)
+        print("Saved {} DNS records to {}, in {}.zone and {} reverse zones".format(zones['records'], args.zones,
+                                                                                 domain, zones['reverse_zones']))
+    if NET_SUMMARY or VERBOSE:
+        print("\nTimings:\n")
+        print(json.dumps(instrument.summary(), indent=4))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,419 @@
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+
+import pytest
+
+import gensynet
+
+needs_numpy = pytest.mark.skipif(gensynet.np is None, reason='needs NumPy')
+
+TIMESTAMP = '2024-01-02 03:04:05.678901'
+
+
+@pytest.fixture(scope='module')
+def subnets():
+    dev_div = {'Business workstation': 300, 'Developer workstation': 120, 'Smartphone': 200, 'Printer': 30,
+               'File server': 20, 'SSH server': 10, 'Unknown': 20}
+    return gensynet.build_configs([150, 200, 100, 250], 700, dev_div, 'corp.example', seed=1)
+
+
+@pytest.mark.parametrize('engine', ['python', pytest.param('numpy', marks=needs_numpy)])
+@pytest.mark.parametrize('prettyprint', [True, False])
+def test_streamed_json_matches_json_dumps(subnets, engine, prettyprint):
+    text = gensynet.build_network(subnets, None, True, prettyprint, engine, seed=3, timestamp=TIMESTAMP)
+    hosts = list(gensynet.iter_hosts(subnets, True, engine, seed=3, timestamp=TIMESTAMP))
+    assert text == json.dumps(hosts, indent=2 if prettyprint else None)
+
+
+@pytest.mark.parametrize('randomspace', [False, True])
+def test_host_at_matches_iter_hosts(subnets, randomspace):
+    hosts = list(gensynet.iter_hosts(subnets, randomspace, seed=5, timestamp=TIMESTAMP))
+    offsets = gensynet.subnet_offsets(subnets)
+    assert len(hosts) == offsets[-1]
+    for i, host in enumerate(hosts):
+        assert gensynet.host_at(subnets, i, 5, randomspace, TIMESTAMP, offsets) == host
+
+
+@pytest.mark.parametrize('fmt', gensynet.FORMATS)
+@pytest.mark.parametrize('compress', [None] + gensynet.COMPRESSIONS)
+def test_formats_round_trip(subnets, tmp_path, fmt, compress):
+    if compress == 'zstd' and gensynet.zstandard is None:
+        pytest.skip('needs zstandard')
+    fname = os.path.join(str(tmp_path), 'net' + gensynet.EXTENSIONS[fmt])
+    gensynet.build_network(subnets, fname, True, seed=2, timestamp=TIMESTAMP, fmt=fmt, compress=compress)
+    assert list(gensynet.read_hosts(fname)) == list(gensynet.iter_hosts(subnets, True, seed=2, timestamp=TIMESTAMP))
+
+
+def test_columnar_round_trip(subnets, tmp_path):
+    fname = os.path.join(str(tmp_path), 'net.gsnc')
+    gensynet.build_network(subnets, fname, True, seed=2, timestamp=TIMESTAMP, fmt='columnar')
+    hosts = list(gensynet.iter_hosts(subnets, True, seed=2, timestamp=TIMESTAMP))
+    assert list(gensynet.read_hosts(fname)) == hosts
+    with gensynet.ColumnarNetwork(fname) as net:
+        assert len(net) == len(hosts)
+        assert net.host(len(hosts) - 1) == hosts[-1]
+
+
+@pytest.mark.parametrize('size', list(range(1, 70)) + [255, 256, 257, 1000, 4096, 5000])
+def test_permute_is_bijection(size):
+    for key in (0, 1, 0x123456789abcdef):
+        assert sorted(gensynet.permute(i, size, key) for i in range(size)) == list(range(size))
+
+
+@pytest.mark.parametrize('base', [1, 2, 6, 36])
+def test_square_permute_is_bijection(base):
+    assert sorted(gensynet._square_permute(i, base, 7) for i in range(base * base)) == list(range(base * base))
+
+
+def test_identities_are_unique(subnets):
+    hosts = list(gensynet.iter_hosts(subnets, seed=4))
+    for field in ('uid', 'mac', 'rDNS_host'):
+        assert len({h[field] for h in hosts}) == len(hosts)
+
+
+@needs_numpy
+@pytest.mark.parametrize('wide', [False, True])
+def test_engines_agree_on_identities(subnets, wide):
+    if wide:                # past the NumPy engine's first block of identities
+        subnets = gensynet.build_configs([250] * 20, 5000, {'Unknown': 5000}, 'corp.example', seed=1)
+
+    def identities(engine):
+        return [(h['uid'], h['mac'], h['rDNS_host'], h['subnet'])
+                for h in gensynet.iter_hosts(subnets, engine=engine, seed=9, timestamp=TIMESTAMP)]
+    assert identities('python') == identities('numpy')
+
+
+@needs_numpy
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+def test_numpy_engine_keeps_unlabeled_hosts(tmp_path, fmt):
+    subnets = gensynet.build_configs([60], 60, {'Printer': 10}, 'corp.example', seed=1)
+    hosts = list(gensynet.iter_hosts(subnets, engine='numpy', seed=3, timestamp=TIMESTAMP))
+    assert len(hosts) == 60
+    assert sum(h['role']['role'] == 'Unknown' for h in hosts) == 50
+    fname = os.path.join(str(tmp_path), 'net' + gensynet.EXTENSIONS[fmt])
+    gensynet.build_network(subnets, fname, engine='numpy', seed=3, timestamp=TIMESTAMP, fmt=fmt)
+    assert list(gensynet.read_hosts(fname)) == hosts
+
+
+def fetch(target, method='GET', body=''):
+    """Asks a NetworkServer on a Unix socket for target, returning the status line, headers and (dechunked) body."""
+    async def exchange(path):
+        server = gensynet.NetworkServer()
+        task = asyncio.ensure_future(server.serve(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write('{} {} HTTP/1.1\r\nContent-Length: {}\r\n\r\n{}'.format(method, target, len(body), body).encode())
+        data = await reader.read()
+        task.cancel()
+        server.close()
+        return data
+    with tempfile.TemporaryDirectory() as tmp:
+        data = asyncio.run(exchange(os.path.join(tmp, 'gensynet.sock'))).decode()
+    head, _, body = data.partition('\r\n\r\n')
+    status, *lines = head.split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines)
+    if headers.get('Transfer-Encoding') == 'chunked':
+        chunks = []
+        while True:
+            size, _, body = body.partition('\r\n')
+            if int(size, 16) == 0:
+                break
+            chunks.append(body[:int(size, 16)])
+            body = body[int(size, 16) + 2:]
+        body = ''.join(chunks)
+    return status, headers, body
+
+
+def test_server_seed_reproduces_seedless_network():
+    status, headers, body = fetch('/network?nodes=300&format=ndjson')
+    assert status == 'HTTP/1.1 200 OK'
+    seed = int(headers['X-Gensynet-Seed'])
+    spec = dict(gensynet.SPEC_DEFAULTS, nodes=300, seed=seed)
+    hosts = [json.loads(line) for line in body.splitlines()]
+    assert len(hosts) == 300
+    assert {h['subnet'] for h in hosts} == {n['subnet'] for n in gensynet.plan_network(spec, gensynet.seeded_rng(seed))}
+    _, _, again = fetch('/network', 'POST', json.dumps({'nodes': 300, 'format': 'ndjson', 'seed': seed}))
+    again = [json.loads(line) for line in again.splitlines()]
+    for h in hosts + again:
+        del h['record']['timestamp']
+    assert again == hosts
+
+
+def test_server_plan_and_bad_requests():
+    status, headers, body = fetch('/plan?nodes=300&seed=1')
+    assert status == 'HTTP/1.1 200 OK' and headers['X-Gensynet-Seed'] == '1'
+    assert sum(n['hosts'] for n in json.loads(body)) == 300
+    assert fetch('/network?colour=red')[0] == 'HTTP/1.1 400 Bad Request'
+    assert fetch('/elsewhere')[0] == 'HTTP/1.1 404 Not Found'
+
+
+@pytest.mark.parametrize('nodes, devices', [(1000, {'Business workstation': 500}), (500, {'Printer': 100}),
+                                            (300, {'Smartphone': 10, 'Unknown': 5})])
+def test_run_spec_honors_device_overrides(tmp_path, nodes, devices):
+    fname = os.path.join(str(tmp_path), 'net.ndjson')
+    spec = {'nodes': nodes, 'devices': devices, 'seed': 1, 'format': 'ndjson', 'output': fname}
+    assert gensynet.run_spec(spec) == fname
+    hosts = list(gensynet.read_hosts(fname))
+    assert len(hosts) == nodes
+    for role, ct in devices.items():
+        if role != 'Unknown':
+            assert sum(h['role']['role'] == role for h in hosts) == ct
+    assert len({h['role']['role'] for h in hosts}) > len(devices) + 5      # the roles left out are still there
+
+
+def test_run_spec_rejects_bad_specs(tmp_path):
+    fname = os.path.join(str(tmp_path), 'net.json')
+    assert gensynet.run_spec({'nodes': 100, 'colour': 'red', 'output': fname}) is None
+    assert gensynet.run_spec({'nodes': 100, 'devices': {'Printer': 101}, 'output': fname}) is None
+    assert not os.path.exists(fname)
+
+
+@pytest.mark.parametrize('supernet, prefixlen', [('10.0.0.0/8', 24), ('192.168.0.0/22', 26), ('fd00::/48', 64)])
+def test_allocate_subnets_fills_supernet(supernet, prefixlen):
+    block = gensynet.ipaddress.ip_network(supernet)
+    slots = 2 ** (prefixlen - block.prefixlen)
+    count = min(slots, 1000)
+    nets = gensynet.allocate_subnets(count, supernet, prefixlen, seed=1)
+    assert len(set(nets)) == count
+    assert all(n.prefixlen == prefixlen and n.subnet_of(block) for n in nets)
+    if slots <= 1000:
+        with pytest.raises(ValueError):
+            gensynet.allocate_subnets(slots + 1, supernet, prefixlen, seed=1)
+
+
+def test_allocate_subnets_rejects_bad_prefixlen():
+    for prefixlen in (7, 33):
+        with pytest.raises(ValueError):
+            gensynet.allocate_subnets(1, '10.0.0.0/8', prefixlen)
+
+
+@pytest.mark.parametrize('prefixlen, nodes, largest', [(24, 1000, 150), (26, 100, 61), (20, 3000, 3000),
+                                                      (20, 20000, 1000)])
+def test_plan_network_bounds_follow_prefixlen(prefixlen, nodes, largest):
+    spec = dict(gensynet.SPEC_DEFAULTS, nodes=nodes, prefixlen=prefixlen, seed=1)
+    capacity = gensynet.subnet_capacity('10.0.0.0/8', prefixlen)
+    for maximum in (None, largest):
+        net_configs = gensynet.plan_network(dict(spec, max=maximum), gensynet.seeded_rng(1))
+        assert sum(n['hosts'] for n in net_configs) == nodes
+        assert all(n['hosts'] <= min(capacity, largest) and n['subnet'].endswith('/{}'.format(prefixlen))
+                   for n in net_configs)
+    if nodes > capacity:
+        assert gensynet.plan_network(dict(spec, max=capacity + 1), gensynet.seeded_rng(1)) is None
+
+
+@pytest.mark.parametrize('capacities', [[150, 200, 100, 250], [1] * 50, [252] * 40, [7]])
+def test_allocate_roles_totals_are_exact(capacities):
+    dev_div = gensynet.get_default_dev_distro(sum(capacities), printout=False)
+    allocation = gensynet.allocate_roles(capacities, dev_div, seed=1)
+    assert [sum(a.values()) for a in allocation] == capacities
+    assert {d: sum(a[d] for a in allocation) for d in dev_div} == dev_div
+
+
+def test_allocate_roles_leaves_spare_slots_unlabeled_and_drops_surplus():
+    allocation = gensynet.allocate_roles([100, 100], {'Printer': 30, 'Smartphone': 20}, seed=2)
+    assert all(sum(a.values()) <= 100 for a in allocation)
+    assert sum(a['Printer'] for a in allocation) == 30 and sum(a['Smartphone'] for a in allocation) == 20
+    allocation = gensynet.allocate_roles([10, 10], {'Printer': 15, 'Smartphone': 15}, seed=2)
+    assert [sum(a.values()) for a in allocation] == [10, 10]
+
+
+@pytest.mark.parametrize('count, minimum, maximum', [(1000, 104, 150), (100000, 104, 150), (253, 1, 252),
+                                                     (500, 0, 3), (1050, 150, 150), (401, 124, 134)])
+def test_randomize_subnet_breakdown_honors_bounds(count, minimum, maximum):
+    for seed in range(5):
+        subnets = gensynet.randomize_subnet_breakdown(count, minimum, maximum, seed)
+        assert sum(subnets) == count
+        assert all(minimum <= s <= maximum for s in subnets)
+
+
+@pytest.mark.parametrize('count, minimum, maximum', [(400, 124, 130), (1001, 150, 150), (0, 1, 2), (10, 5, 4),
+                                                     (10, -1, 4), (10, 0, 0)])
+def test_randomize_subnet_breakdown_rejects_infeasible_bounds(count, minimum, maximum):
+    assert gensynet.randomize_subnet_breakdown(count, minimum, maximum, 1) is None
+
+
+@pytest.mark.parametrize('fmt, domain', [('ndjson', 'corp.example'), ('csv', 'café.example')])
+def test_instrumentation_counts_network_bytes_and_time(tmp_path, fmt, domain):
+    subnets = gensynet.build_configs([150, 200], 350, {'Printer': 50}, domain, seed=1)
+    fname = os.path.join(str(tmp_path), 'net' + gensynet.EXTENSIONS[fmt])
+    instrument = gensynet.Instrumentation()
+    gensynet.build_network(subnets, fname, seed=1, fmt=fmt, instrument=instrument)
+    summary = instrument.summary()
+    header = len(','.join(gensynet.CSV_FIELDS)) + 1 if fmt == 'csv' else 0
+    assert summary['hosts'] == 350 and summary['subnets'] == 2
+    assert summary['bytes'] == os.path.getsize(fname) - header
+    with instrument.phase('flows'):
+        time.sleep(0.05)
+    assert instrument.summary()['elapsed'] == summary['elapsed']
+    assert instrument.summary()['hosts_per_sec'] == summary['hosts_per_sec']
+
+
+@pytest.mark.parametrize('fmt', gensynet.FLOW_FORMATS)
+def test_flow_records_follow_flow_types(subnets, fmt):
+    hosts = list(gensynet.iter_hosts(subnets, seed=1))
+    roles = {h['IP']: h['role']['role'] for h in hosts}
+    text = io.StringIO()
+    gensynet.FlowGenerator(hosts, seed=2).write(text, 5000, fmt, start=1.5e9)
+    lines = text.getvalue().splitlines()
+    if fmt == 'csv':
+        assert lines.pop(0) == ','.join(gensynet.FLOW_FIELDS)
+        lines = [dict(zip(gensynet.FLOW_FIELDS, line.split(','))) for line in lines]
+        for r in lines:
+            r.update((f, int(r[f])) for f in ('sport', 'dport', 'bytes', 'packets'))
+            r['timestamp'] = float(r['timestamp'])
+    else:
+        lines = [json.loads(line) for line in lines]
+    assert lines == list(gensynet.FlowGenerator(hosts, seed=2).records(5000, start=1.5e9))
+    kinds = {(c, s, proto, port) for c, s, proto, port, weight, size in gensynet.FLOW_TYPES}
+    assert all((roles[r['src']], roles[r['dst']], r['proto'], r['dport']) in kinds for r in lines)
+    assert all(1.5e9 < a['timestamp'] <= b['timestamp'] for a, b in zip(lines, lines[1:]))
+    assert all(49152 <= r['sport'] < 65536 and r['bytes'] >= 40 and r['packets'] == 1 + r['bytes'] // 1000
+               for r in lines)
+
+
+def test_flow_generator_needs_ipv4_and_flow_hosts(subnets):
+    hosts = list(gensynet.iter_hosts(subnets, seed=1))
+    with pytest.raises(ValueError):
+        gensynet.FlowGenerator([dict(hosts[0], IP='fd00::2')])
+    with pytest.raises(ValueError):
+        gensynet.FlowGenerator([h for h in hosts if h['role']['role'] == 'Printer'])
+
+
+def check_evolution(evolution, subnets):
+    hosts = list(evolution)
+    assert len(hosts) == len(evolution)
+    for field in ('uid', 'mac', 'IP'):
+        assert len({h[field] for h in hosts}) == len(hosts)
+    nets = {n['subnet']: gensynet.ipaddress.ip_network(n['subnet']) for n in subnets}
+    assert all(gensynet.ipaddress.ip_address(h['IP']) in nets[h['subnet']] for h in hosts)
+    assert evolution.room.total == sum(evolution._room(s) for s in range(len(subnets)))
+    return hosts
+
+
+@pytest.mark.parametrize('randomspace', [False, True])
+def test_evolution_keeps_addresses_and_identities_unique(subnets, randomspace):
+    evolution = gensynet.NetworkEvolution(subnets, seed=3, randomspace=randomspace, timestamp=TIMESTAMP,
+                                          rates={'join': 0.2, 'leave': 0.2, 'dhcp': 0.2, 'fingerprint': 0.2})
+    key = lambda h: h['uid']
+    assert sorted(evolution, key=key) == sorted(gensynet.iter_hosts(subnets, randomspace, seed=3,
+                                                                    timestamp=TIMESTAMP), key=key)
+    live = {h['uid'] for h in evolution}
+    for event in evolution.evolve(10):
+        if event['event'] == 'add':
+            assert event['host']['uid'] not in live
+            live.add(event['host']['uid'])
+        elif event['event'] == 'remove':
+            live.remove(event['uid'])
+    assert {h['uid'] for h in check_evolution(evolution, subnets)} == live
+    assert not evolution.untouched == [n['hosts'] for n in subnets]
+
+
+def test_evolution_joins_only_where_there_is_room():
+    subnets = gensynet.build_configs([13, 13], 26, {'Printer': 26}, prefixlen=28, seed=1)
+    only = lambda kind, rate: dict(dict.fromkeys(gensynet.CHURN_RATES, 0), **{kind: rate})
+    evolution = gensynet.NetworkEvolution(subnets, seed=1, randomspace=True, rates=only('join', 1.0))
+    assert evolution.room.total == 0
+    assert evolution.step() == []
+    evolution.rates = only('leave', 0.3)
+    left = sum(e['event'] == 'remove' for e in evolution.step())
+    assert left and evolution.room.total == left
+    evolution.rates = only('join', 5.0)
+    joined = sum(e['event'] == 'add' for e in evolution.evolve(3))
+    assert joined == left and evolution.room.total == 0 and len(evolution) == 26
+    check_evolution(evolution, subnets)
+
+
+def test_network_set_remove_and_widen(subnets, tmp_path):
+    hosts = list(gensynet.iter_hosts(subnets, True, seed=2, timestamp=TIMESTAMP))
+    net = gensynet.build_model(subnets, True, seed=2, timestamp=TIMESTAMP)
+    assert list(net) == hosts
+
+    net[1].os = 'Linux'
+    net.set('role', 2, 'Quantum computer')             # not in the role table yet
+    net.set('rDNS_host', 3, 'renamed')
+    hosts[1]['os']['os'] = 'Linux'
+    hosts[2]['role']['role'] = 'Quantum computer'
+    hosts[3]['rDNS_host'] = 'renamed'
+    with pytest.raises(ValueError):
+        net.set('rDNS_host', 0, 'muchtoolong')
+    with pytest.raises(IndexError):
+        net.set('os', len(net), 'Linux')
+
+    net.remove(0)
+    hosts[0] = hosts.pop()
+    assert len(net) == len(hosts) and list(net) == hosts
+    with pytest.raises(IndexError):
+        net.remove(len(net))
+
+    net.set('IP', 4, 'fd00::5')                         # IPv4 addresses are mapped into the widened column
+    hosts[4]['IP'] = 'fd00::5'
+    assert net.ipv6 and list(net) == hosts
+    net.append(hosts[0])
+    fname = os.path.join(str(tmp_path), 'net.gsnc')
+    net.save(fname)
+    assert list(gensynet.read_network(fname)) == hosts + hosts[:1]
+
+
+@pytest.mark.parametrize('change, kinds', [
+    (lambda h, other: h.pop('role'), {'malformed host', 'host count', 'role count'}),
+    (lambda h, other: h.update(subnet='nonsense'), {'bad subnet', 'host count', 'role count'}),
+    (lambda h, other: h.update(subnet='192.0.2.0/24', IP='192.0.2.9'), {'unknown subnet', 'host count', 'role count'}),
+    (lambda h, other: h['os'].update(os='TempleOS'), {'OS for role'}),
+    (lambda h, other: h.update(IP='10.1.2.300'), {'bad IP'}),
+    (lambda h, other: h.update(IP='192.0.2.9'), {'IP outside subnet'}),
+    (lambda h, other: h.update(IP=h['subnet'].partition('/')[0]), {'reserved IP'}),
+    (lambda h, other: h.update(IP=other['IP']), {'duplicate IP'}),
+])
+def test_validator_finds_each_violation(subnets, change, kinds):
+    hosts = list(gensynet.iter_hosts(subnets, True, seed=2))
+    validator = gensynet.NetworkValidator(subnets)
+    for h in hosts:
+        validator.add(h)
+    assert validator.report()['valid']
+
+    hosts[0] = json.loads(json.dumps(hosts[0]))
+    change(hosts[0], hosts[1])
+    validator = gensynet.NetworkValidator(subnets)
+    for h in hosts:
+        validator.add(h)
+    report = validator.report()
+    assert not report['valid'] and set(report['violations']) == kinds
+    assert len(report['examples']) == sum(report['violations'].values())
+
+
+def read_zone(fname):
+    """Returns the (owner, type, value) of every record in a zone file written by write_zones(), besides SOA and NS."""
+    records = []
+    with open(fname) as zone:
+        for line in zone:
+            if line.startswith('$ORIGIN'):
+                origin = line.split()[1]
+            elif not line.startswith(('$', '@', '\t')):
+                name, _, kind, value = line.split('\t')
+                records.append((name + '.' + origin, kind, value.strip()))
+    return records
+
+
+def test_write_zones_has_a_record_and_ptr_per_host(subnets, tmp_path, monkeypatch):
+    hosts = list(gensynet.iter_hosts(subnets, True, seed=2))
+    monkeypatch.setattr(gensynet, 'ZONE_BUFFER', 7)     # many flushes, each appending to zones started before
+    stats = gensynet.write_zones(hosts, str(tmp_path), serial=1)
+    zones = sorted(os.listdir(str(tmp_path)))
+    reverse = {'{2}.{1}.{0}.in-addr.arpa.zone'.format(*h['IP'].split('.')) for h in hosts}
+    assert zones == sorted(reverse | {'corp.example.zone'})
+    assert stats == {'records': 2 * len(hosts), 'reverse_zones': len(reverse), 'out_of_zone': 0}
+
+    fqdn = {h['IP']: '{}.{}.'.format(h['rDNS_host'], h['rDNS_domain']) for h in hosts}
+    assert sorted(read_zone(os.path.join(str(tmp_path), 'corp.example.zone'))) == \
+        sorted((name, 'A', ip) for ip, name in fqdn.items())
+    ptrs = [r for zone in reverse for r in read_zone(os.path.join(str(tmp_path), zone))]
+    assert sorted(ptrs) == sorted(('{3}.{2}.{1}.{0}.in-addr.arpa.'.format(*ip.split('.')), 'PTR', name)
+                                  for ip, name in fqdn.items())
+
+    other = os.path.join(str(tmp_path), 'other')
+    assert gensynet.write_zones(hosts, other, 'other.example')['out_of_zone'] == len(hosts)